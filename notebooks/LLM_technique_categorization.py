@@ -0,0 +1,74 @@
+from openai import OpenAI
+import sys
+sys.path.append("../src")
+from utils import *
+from llm_cache import LLMCache
+from llm_batch import run_batch, responses_body
+from technique_categorization import TechniqueCategorizer, technique_prompt, categorize_tables
+from embedding_store import EmbeddingStore
+from technique_scoring import TechniqueScorer
+import pandas as pd
+import os
+
+data_dir = ".."
+
+# The three tables categorized together: a text shared by several of them is
+# only sent once
+clusters_path = os.path.join(data_dir, "other_outputs", "revision_clusters_sorted.csv")
+cluster_topics_path = os.path.join(data_dir, "other_outputs", "bertopic_per_cluster_topic_assignments_sorted.csv")
+topics_path = os.path.join(data_dir, "other_outputs", "entries_exclusive_to_general_topics.csv")
+clusters = pd.read_csv(clusters_path)
+cluster_topics = pd.read_csv(cluster_topics_path).rename(columns={"Cluster": "cluster", "Topic": "topic"})
+topics = pd.read_csv(topics_path)
+
+# "interactive": one Responses API call per text; "batch": OpenAI Batch API
+execution_mode = "interactive"
+batch_directory = os.path.join(data_dir, "batch_runs", "techniques")
+# e.g. "http://localhost:8089/v1" to run batch mode against batch_stub_server.py
+batch_base_url = None
+# Take the technique closest to the analysis embedding when it clearly beats the
+# runner-up (see src/technique_scoring.py); only the close calls go to the LLM.
+# Off until `python technique_scoring.py` has shown how often the confident
+# guesses agree with the LLM labels, and min_margin is chosen from that.
+zero_shot_scoring = False
+
+client = OpenAI(api_key=OPENAI_API_KEY)
+batch_client = OpenAI(api_key=OPENAI_API_KEY, base_url=batch_base_url)
+cache = LLMCache()
+# Shared with the other technique stages (see src/technique_categorization.py):
+# texts already categorized there, e.g. streamed by LLM_detection_batch.py, are
+# cache hits, and duplicate texts are only sent once
+categorizer = TechniqueCategorizer(client, cache)
+
+
+# Copy to new DataFrames
+clusters_new = clusters.copy()[['cluster', 'source', 'original_text']]
+cluster_topics_new = cluster_topics.copy()[['cluster', 'topic', 'source', 'original_text']]
+topics_new = topics.copy()[['topic', 'source', 'original_text']]
+all_texts = pd.concat([clusters_new['original_text'], cluster_topics_new['original_text'],
+                       topics_new['original_text']]).unique()
+
+guesses = None
+if zero_shot_scoring:
+    scorer = TechniqueScorer(EmbeddingStore())
+    guesses = scorer.guesses(all_texts)
+    scorer.print_stats()
+
+# In batch mode the distinct texts left to the LLM are answered through the
+# Batch API first; the categorizer below then serves them from the cache
+if execution_mode == "batch":
+    llm_texts = [text for text in all_texts if text not in (guesses or {})]
+    requests = ((str(idx), responses_body("gpt-4o-mini", technique_prompt(text)))
+                for idx, text in enumerate(llm_texts))
+    run_batch(batch_client, requests, batch_directory, cache, url="/v1/responses")
+
+output_directory = os.path.join(data_dir, "other_outputs", "weaponization_analysis")
+tables = {
+    os.path.join(output_directory, "clusters_with_weaponization_techniques.csv"): clusters_new,
+    os.path.join(output_directory, "cluster_topics_with_weaponization_techniques.csv"): cluster_topics_new,
+    os.path.join(output_directory, "topics-exclusive_with_weaponization_techniques.csv"): topics_new,
+}
+categorize_tables(categorizer, tables, guesses=guesses)
+categorizer.shutdown()
+categorizer.print_stats()
+cache.print_stats()
@@ -1,28 +1,126 @@
 import json
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import os
 import sys
-import difflib
+import random
+import asyncio
 import concurrent.futures
 
 #sys.path.append('../')
 from utils import *
+from record_stream import iter_jsonl, save_lines, count_records
+from word_diff import diff_words
+from llm_cache import LLMCache, cached_chat_completion
+from llm_engine import AsyncLLMEngine, run_ordered, estimate_tokens
+from llm_batch import run_batch, chat_body
+from judgments import (judgment_format, answer_instruction, parse_judgment, judgment_row, merge_judgments,
+                       split_packed_judgments)
+from prompt_compaction import compact_records, CompactionStats
+from record_packing import pack, PackingStats, compare_judgments, print_comparison
+from triage import triage_record, TriageStats
+from technique_categorization import TechniqueCategorizer, TechniqueStream
 
 input_directory = "../enriched_sample_subset"
 output_directory = "../txt_results"
 os.makedirs(output_directory, exist_ok=True)
 
+# "async": records of all files share one rate-limited, adaptive request engine
+# "threads": one thread per file, records of a file sent one after the other
+# "batch": full-corpus runs through the OpenAI Batch API (cheaper, not interactive)
+# "validate_packing": judge a fixed sample both one by one and packed, and compare
+execution_mode = "async"
+batch_directory = "../batch_runs/detection"
+# e.g. "http://localhost:8089/v1" to run batch mode against batch_stub_server.py
+batch_base_url = None
+# "structured": JSON-schema constrained {judgment, explanation, indicators}, one
+#               row per record in <source>_judgments.jsonl (see judgments.py)
+# "text": the free-text _analysis.txt files parsed by combine_csv.ipynb (the
+#         default, read by the downstream notebooks)
+output_format = "text"
+# Drop the raw Diff, keep only excerpts of the unchanged context next to each
+# change and split long first_version articles (see prompt_compaction.py)
+compact_prompts = True
+# Send consecutive small diff records together, up to the token budget of
+# record_packing.py, with one judgment per record id. Check the agreement with
+# execution_mode = "validate_packing" before turning it on for a corpus.
+pack_records = False
+# Clear whitespace, markup, interwiki, bot and other trivial edits locally as
+# "Not Weaponised" (see triage.py). Off until `python triage.py` has measured
+# its clearing precision and weaponised recall against earlier LLM judgments
+# of the same records.
+triage_records = False
+validation_sample_size = 200
+validation_seed = 42
+# Pro-/Anti-Armenian stance of the weaponised records:
+# "combined": asked in the same request as the judgment (a "stance" field and a
+#             Stance column in the judgments), no second pass over the records
+# "stream": each weaponised record goes straight from its detection answer to
+#           the stance prompt of LLM_detection_batch_multifactional.py, written
+#           to its _finegrained_analysis.txt files without the CSV round-trip
+# None: detection only, stance from a later LLM_detection_batch_multifactional.py run
+#       (the default; the other modes change what a run writes)
+stance_mode = None
+# Name the weaponisation technique of each weaponised record while detection
+# is still running, into <source>_techniques.jsonl (see technique_categorization.py);
+# the cluster and topic categorization stages then find them in the cache.
+# Off by default: it adds an LLM call per weaponised record
+categorize_techniques = False
+
+if pack_records and not (compact_prompts and output_format == "structured"):
+    raise ValueError('pack_records needs compact_prompts and output_format = "structured"')
+if stance_mode is not None and output_format != "structured":
+    raise ValueError('stance_mode needs output_format = "structured"')
+if categorize_techniques and output_format != "structured":
+    raise ValueError('categorize_techniques needs output_format = "structured"')
 
 client = OpenAI(api_key="your_openai_api_key_here")
+async_client = AsyncOpenAI(api_key="your_openai_api_key_here")
+batch_client = OpenAI(api_key="your_openai_api_key_here", base_url=batch_base_url)
+cache = LLMCache()
+compaction = CompactionStats()
+packing = PackingStats()
+triage = TriageStats()
+categorizer = TechniqueCategorizer(client, cache)
+
+if stance_mode == "stream":
+    # given this module's client and cache, so both stages share the cache stats
+    import LLM_detection_batch_multifactional as stance_stage
+
+SYSTEM_PROMPT = "You are a neutral linguistic analysis expert focused on detecting weaponization of cultural heritage."
+
+SINGLE_INPUT = "The input is a JSON record representing a Wikipedia article revision. The record follows one of these structures:"
+PACKED_INPUT = 'The input is a JSON list of records, each representing a Wikipedia article revision and identified by its "id". Every record follows one of these structures:'
+
+# Record layouts described to the model, for full and compact records
+FULL_RECORD_STRUCTURES = """1. For the original article version (version "first_version"):
+   {
+     "version": "first_version",
+     "Content": "<full article text>"
+   }
+2. For a revision (version "diff"):
+   {
+     "version": "diff",
+     "Timestamp": "<ISO timestamp>",
+     "User": "<editor identifier>",
+     "Comment": "<revision comment>",
+     "Diff": "<original textual diff in unified diff format>"
+     "Added_Lines": [<list of lines outright added>],
+     "Removed_Lines": [<list of lines outright removed>],
+     "Added_Words": [<list of words added in modified sentences>],
+     "Removed_Words": [<list of words removed in modified sentences>]
+   }
+"""
+FULL_CONTEXT_INSTRUCTION = "- Ignore lines in the Diff field that have no prefix — these are unchanged context."
+COMPACT_RECORD_STRUCTURES = """1. Original article version: {"version": "first_version", "Content": "<article text>", "Part": "<i/n, only when a long article is split>"}
+2. Revision: {"version": "diff", "Timestamp", "User", "Comment", "Added_Lines": [<lines outright added>], "Removed_Lines": [<lines outright removed>], "Added_Words"/"Removed_Words": [<words added/removed in modified sentences>], "Modified_Lines": [<modified sentences around the edit, after it>], "Context": [<excerpts of unchanged lines next to the changes>]}
+Empty fields are left out.
+"""
+COMPACT_CONTEXT_INSTRUCTION = "- The Context and Modified_Lines excerpts only show where a change happened; judge the changes, not the unchanged text."
 
+combined_stance = stance_mode == "combined"
+# Extra chat request options of the selected output format
+request_options = {"response_format": judgment_format(stance=combined_stance)} if output_format == "structured" else {}
 
-def load_jsonl(filepath):
-    records = []
-    with open(filepath, "r", encoding="utf-8") as f:
-        for line in f:
-            if line.strip():
-                records.append(json.loads(line))
-    return records
 
 def parse_unidiff(diff_text):
     added_lines, removed_lines, word_added, word_removed = [], [], [], []
@@ -37,12 +135,9 @@ def parse_unidiff(diff_text):
             removed_line = line[1:].strip()
             if i + 1 < len(lines) and lines[i + 1].startswith('+'):
                 added_line = lines[i + 1][1:].strip()
-                diff = difflib.ndiff(removed_line.split(), added_line.split())
-                for word in diff:
-                    if word.startswith('+ '):
-                        word_added.append(word[2:])
-                    elif word.startswith('- '):
-                        word_removed.append(word[2:])
+                added, removed = diff_words(removed_line.split(), added_line.split())
+                word_added.extend(added)
+                word_removed.extend(removed)
                 i += 2
             else:
                 removed_lines.append(removed_line)
@@ -54,7 +149,7 @@ def parse_unidiff(diff_text):
             i += 1
     return added_lines, removed_lines, word_added, word_removed
 
-def detect_weaponisation(record):
+def enrich_record(record):
     if record.get("version") == "diff":
         diff_text = record.get("Diff", "")
         added_lines, removed_lines, word_added, word_removed = parse_unidiff(diff_text)
@@ -62,34 +157,35 @@ def detect_weaponisation(record):
         record["Removed_Lines"] = removed_lines
         record["Added_Words"] = word_added
         record["Removed_Words"] = word_removed
+    return record
+
+def build_prompt(record, compact=False):
+    if compact:
+        record_json = json.dumps(record, ensure_ascii=False)
+        record_structures, context_instruction = COMPACT_RECORD_STRUCTURES, COMPACT_CONTEXT_INSTRUCTION
+    else:
+        record_json = json.dumps(record, indent=2, ensure_ascii=False)
+        record_structures, context_instruction = FULL_RECORD_STRUCTURES, FULL_CONTEXT_INSTRUCTION
+    instruction = answer_instruction(stance=combined_stance) if output_format == "structured" else "Your analysis:"
+    return render_prompt(SINGLE_INPUT, record_structures, context_instruction, record_json, instruction)
 
-    record_json = json.dumps(record, indent=2, ensure_ascii=False)
+def build_packed_prompt(parts):
+    """
+    parts: list of (record id, compact record)
+    """
+    records_json = json.dumps([{"id": record_id, **part} for record_id, part in parts], ensure_ascii=False)
+    return render_prompt(PACKED_INPUT, COMPACT_RECORD_STRUCTURES, COMPACT_CONTEXT_INSTRUCTION, records_json,
+                         answer_instruction(stance=combined_stance, packed=True))
 
+def render_prompt(input_description, record_structures, context_instruction, record_json, answer_instruction):
     prompt = f"""
 You are an expert linguistic analysis assistant specializing in detecting subtle shifts in language that might be used to weaponize cultural heritage.
 
-The input is a JSON record representing a Wikipedia article revision. The record follows one of these structures:
-1. For the original article version (version "first_version"):
-   {{
-     "version": "first_version",
-     "Content": "<full article text>"
-   }}
-2. For a revision (version "diff"):
-   {{
-     "version": "diff",
-     "Timestamp": "<ISO timestamp>",
-     "User": "<editor identifier>",
-     "Comment": "<revision comment>",
-     "Diff": "<original textual diff in unified diff format>"
-     "Added_Lines": [<list of lines outright added>],
-     "Removed_Lines": [<list of lines outright removed>],
-     "Added_Words": [<list of words added in modified sentences>],
-     "Removed_Words": [<list of words removed in modified sentences>]
-   }}
-
+{input_description}
+{record_structures}
 ⚠️ Important Instructions:
 - If the version is "diff", focus primarily on the Added_Lines, Removed_Lines, Added_Words, and Removed_Words fields, i.e. on the lines (and words) actually added or deleted (i.e. not the lines that are untouched) as well as whatever additional context provided by the "User" and "Comment" fields.
-- Ignore lines in the Diff field that have no prefix — these are unchanged context.
+{context_instruction}
 - Do not evaluate unchanged paragraphs for weaponization unless they were modified.
 - For an original version (version "first_version"), treat it as baseline text.
 - Analyze the text for subtle shifts in tone, style, or content that may be used to weaponize cultural heritage.
@@ -122,44 +218,369 @@ Note that each entry might not strictly immediately follow prior ones, so only j
 Here is the input JSON:
 {record_json}
 
-Your analysis:
+{answer_instruction}
 """
+    return prompt
+
+def build_prompts(record, track=True):
+    """
+    record: an enriched record (see enrich_record)
+    track: add the savings to the run's compaction stats
+
+    Returns: (parts, prompts, saved) - the records the prompts render (several
+    compact parts for a split first_version), the prompts and the estimated
+    input tokens saved by compaction.
+    """
+    full_prompt = build_prompt(record)
+    if not compact_prompts:
+        return [record], [full_prompt], 0
+    parts = compact_records(record)
+    prompts = [build_prompt(part, compact=True) for part in parts]
+    if not track:
+        return parts, prompts, 0
+    return parts, prompts, compaction.add(full_prompt, prompts)
+
+def iter_units(records, track=True, packed=None):
+    """
+    records: iterable of (idx, record)
+    packed: overrides pack_records
+
+    Yields: (entries, prompts) - the records sent together and their prompts.
+    entries is a list of (idx, record, single-record prompts, saved); a packed
+    unit holds several entries and one packed prompt, a record cleared by the
+    triage is a unit without prompts.
+    """
+    packed = pack_records if packed is None else packed
+
+    def sized():
+        for idx, record in records:
+            enrich_record(record)
+            if triage_records:
+                cleared, reason = triage_record(record)
+                if track:
+                    triage.add(cleared, reason)
+                if cleared:
+                    record["Triage"] = reason
+                    yield None, ((idx, record, [], 0), None)
+                    continue
+            parts, prompts, saved = build_prompts(record, track)
+            entry = (idx, record, prompts, saved)
+            if packed and len(parts) == 1 and record.get("version") == "diff":
+                yield estimate_tokens(json.dumps(parts[0], ensure_ascii=False)), (entry, parts[0])
+            else:
+                yield None, (entry, None)
+
+    for group in pack(sized()):
+        if len(group) == 1:
+            entry, _ = group[0]
+            yield [entry], entry[2]
+            continue
+        entries = [entry for entry, _ in group]
+        prompt = build_packed_prompt([(entry[0], part) for entry, part in group])
+        if track:
+            packing.add(len(entries), sum(estimate_tokens(entry[2][0]) for entry in entries), estimate_tokens(prompt))
+        yield entries, [prompt]
+
+def unit_request(entries):
+    # (max_tokens, extra request options) of the prompts of a unit
+    if len(entries) > 1:
+        return 300 * len(entries), {"response_format": judgment_format(stance=combined_stance, packed=True)}
+    return 300, request_options
+
+def merge_analyses(analyses):
+    # the parts of a split first_version are judged one by one
+    if len(analyses) == 1:
+        return analyses[0]
+    if output_format == "structured":
+        return merge_judgments(analyses)
+    return "\n\n".join(f"Part {k}/{len(analyses)}:\n{a}" for k, a in enumerate(analyses, start=1))
+
+def unit_analyses(entries, answers):
+    """
+    answers: the responses to the prompts of the unit
+
+    Returns: one analysis per entry; None for records a packed answer left out.
+    """
+    if len(entries) == 1 and not entries[0][2]:
+        return [cleared_analysis(entries[0][1])]
+    if len(entries) == 1:
+        return [merge_analyses(answers)]
+    by_id = split_packed_judgments(answers[0])
+    return [by_id.get(idx) for idx, _, _, _ in entries]
 
+def cleared_analysis(record):
+    explanation = f"Auto-cleared by the local triage ({record['Triage']}), not sent to the LLM."
+    if output_format == "structured":
+        judgment = {"judgment": "Not Weaponised", **({"stance": "None"} if combined_stance else {})}
+        return json.dumps({**judgment, "explanation": explanation, "indicators": []})
+    return f"**Judgment: Not Weaponised**\n\n**Explanation:** {explanation}"
+
+def chat(prompt, max_tokens=300, options=None):
+    options = request_options if options is None else options
+    return cached_chat_completion(client, cache, "gpt-4o-mini", SYSTEM_PROMPT, prompt, temperature=0,
+                                  max_tokens=max_tokens, **options)
+
+def detect_weaponisation(entries, prompts):
+    """
+    Returns: one analysis per entry of the unit.
+    """
+    max_tokens, options = unit_request(entries)
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a neutral linguistic analysis expert focused on detecting weaponization of cultural heritage."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0,
-            max_tokens=300
-        )
-        return response.choices[0].message.content.strip()
+        analyses = unit_analyses(entries, [chat(prompt, max_tokens, options) for prompt in prompts])
     except Exception as e:
-        return f"Error during API call: {e}"
+        return [f"Error during API call: {e}"] * len(entries)
+    for k, (_, _, single_prompts, _) in enumerate(entries):
+        if analyses[k] is None:
+            # left out of the packed answer: judged on its own
+            packing.add_fallback()
+            try:
+                analyses[k] = merge_analyses([chat(prompt) for prompt in single_prompts])
+            except Exception as e:
+                analyses[k] = f"Error during API call: {e}"
+    return analyses
+
+def source_name(file_path):
+    return os.path.splitext(os.path.basename(file_path))[0].replace("_enriched", "")
+
+def analysis_output_path(file_path):
+    if output_format == "structured":
+        return f"{output_directory}/{source_name(file_path)}_judgments.jsonl"
+    return f"{output_directory}/{source_name(file_path)}_analysis.txt"
+
+def format_analysis(idx, record, analysis, source=None):
+    if output_format == "structured":
+        row = judgment_row(source, idx, record, parse_judgment(analysis))
+        return json.dumps(row, ensure_ascii=False) + "\n"
+    return f"Record {idx} (Version: {record.get('version', 'N/A')}):\n{analysis}\n{'-'*80}\n"
+
+def stance_output_path(file_path):
+    # where LLM_detection_batch_multifactional.py would write it from the CSV
+    return stance_stage.analysis_output_path(f"{source_name(file_path)}_output.csv")
+
+def technique_output_path(file_path):
+    return f"{output_directory}/{source_name(file_path)}_techniques.jsonl"
+
+def weaponised_row(idx, record, analysis, source):
+    """
+    Returns: the *_output.csv row the later stages (stance, techniques) read
+    for a weaponised record, None for the other records.
+    """
+    judgment = parse_judgment(analysis)
+    if judgment["judgment"] != "Weaponised":
+        return None
+    row = judgment_row(source, idx, record, judgment)
+    del row["Stance"]
+    return row
+
+def iter_analyses(input_file, stance_output=None, techniques=None):
+    # records are streamed from disk and each result is handed to the writer as
+    # soon as it is available, so nothing is accumulated per file
+    for entries, prompts in iter_units(enumerate(iter_jsonl(input_file), start=1)):
+        for (idx, record, _, saved), analysis in zip(entries, detect_weaponisation(entries, prompts)):
+            print(analysis)
+            yield format_analysis(idx, record, analysis, source_name(input_file))
+            row = weaponised_row(idx, record, analysis, source_name(input_file)) if stance_output or techniques else None
+            if row is not None and techniques is not None:
+                techniques.add(row)
+            if row is not None and stance_output is not None:
+                stance_analysis = stance_stage.detect_weaponisation(row, client, cache)
+                stance_output.write(stance_stage.format_analysis(idx, record, stance_analysis))
+            print(f"[{input_file}] Processed record {idx} ({saved} input tokens saved)")
+
+def close_techniques(input_file, techniques):
+    techniques.close()
+    print(f"[{input_file}] Saved {techniques.count} techniques to {techniques.output_path}")
 
 def analyze_file(input_file):
-    records = load_jsonl(input_file)
-    print(f"[{input_file}] Loaded {len(records)} records.")
-    results = []
-
-    for idx, record in enumerate(records, start=1):
-        analysis = detect_weaponisation(record)
-        print(analysis)
-        results.append(f"Record {idx} (Version: {record.get('version', 'N/A')}):\n{analysis}\n{'-'*80}\n")
-        print(f"[{input_file}] Processed record {idx}/{len(records)}")
-    return (input_file, results)
-
-def save_analysis_result(file_path, results):
-    base_name = os.path.splitext(os.path.basename(file_path))[0].replace("_enriched", "")
-    output_file = f"{output_directory}/{base_name}_analysis.txt"
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.writelines(results)
-    print(f"[{file_path}] Saved analysis to {output_file}")
+    output_file = analysis_output_path(input_file)
+    techniques = TechniqueStream(categorizer, technique_output_path(input_file)) if categorize_techniques else None
+    if stance_mode != "stream":
+        count = save_lines(output_file, iter_analyses(input_file, techniques=techniques))
+    else:
+        stance_file = stance_output_path(input_file)
+        with open(stance_file + ".tmp", "w", encoding="utf-8") as stance_output:
+            count = save_lines(output_file, iter_analyses(input_file, stance_output, techniques))
+        os.replace(stance_file + ".tmp", stance_file)
+        print(f"[{input_file}] Saved stance analyses to {stance_file}")
+    print(f"[{input_file}] Saved {count} analyses to {output_file}")
+    if techniques is not None:
+        close_techniques(input_file, techniques)
+    return (input_file, count)
+
+# ----------------------------
+# Async Execution Section
+# ----------------------------
+
+async def analyze_files_async(jsonl_files):
+    engine = AsyncLLMEngine(async_client, cache)
+    outputs = {}
+    stance_outputs = {}
+    techniques = {}
+    written = {f: 0 for f in jsonl_files}
+
+    async def achat(prompt, max_tokens=300, options=None):
+        options = request_options if options is None else options
+        return await engine.chat("gpt-4o-mini", SYSTEM_PROMPT, prompt, temperature=0, max_tokens=max_tokens, **options)
 
+    async def stance(row):
+        if row is None:
+            return None
+        try:
+            return await engine.chat("gpt-4o-mini", stance_stage.SYSTEM_PROMPT, stance_stage.build_prompt(row),
+                                     temperature=0, max_tokens=300)
+        except Exception as e:
+            return f"Error during API call: {e}"
+
+    async def handle(item):
+        # same as detect_weaponisation; returns (analysis, stance analysis) per entry
+        source, (entries, prompts) = item
+        max_tokens, options = unit_request(entries)
+        try:
+            answers = await asyncio.gather(*(achat(prompt, max_tokens, options) for prompt in prompts))
+            analyses = unit_analyses(entries, answers)
+        except Exception as e:
+            return [(f"Error during API call: {e}", None)] * len(entries)
+        for k, (_, _, single_prompts, _) in enumerate(entries):
+            if analyses[k] is None:
+                packing.add_fallback()
+                try:
+                    analyses[k] = merge_analyses(await asyncio.gather(*(achat(p) for p in single_prompts)))
+                except Exception as e:
+                    analyses[k] = f"Error during API call: {e}"
+        if stance_mode != "stream":
+            return [(analysis, None) for analysis in analyses]
+        rows = [weaponised_row(idx, record, analysis, source) for (idx, record, _, _), analysis in zip(entries, analyses)]
+        return list(zip(analyses, await asyncio.gather(*(stance(row) for row in rows))))
+
+    def write(input_file, _, item, results):
+        # called in record order for each file, whatever order the calls finish in
+        if input_file not in outputs:
+            outputs[input_file] = open(analysis_output_path(input_file) + ".tmp", "w", encoding="utf-8")
+            if stance_mode == "stream":
+                stance_outputs[input_file] = open(stance_output_path(input_file) + ".tmp", "w", encoding="utf-8")
+            if categorize_techniques:
+                techniques[input_file] = TechniqueStream(categorizer, technique_output_path(input_file))
+        for (idx, record, _, saved), (analysis, stance_analysis) in zip(item[1][0], results):
+            outputs[input_file].write(format_analysis(idx, record, analysis, source_name(input_file)))
+            row = weaponised_row(idx, record, analysis, source_name(input_file)) if categorize_techniques else None
+            if row is not None:
+                techniques[input_file].add(row)
+            if stance_analysis is not None:
+                stance_outputs[input_file].write(stance_stage.format_analysis(idx, record, stance_analysis))
+            written[input_file] += 1
+            print(f"[{input_file}] Processed record {idx} ({saved} input tokens saved)")
+
+    def finish(input_file, _):
+        output_file = analysis_output_path(input_file)
+        if input_file in outputs:
+            outputs.pop(input_file).close()
+            os.replace(output_file + ".tmp", output_file)
+        else:
+            save_lines(output_file, [])
+        if stance_mode == "stream":
+            stance_file = stance_output_path(input_file)
+            if input_file in stance_outputs:
+                stance_outputs.pop(input_file).close()
+                os.replace(stance_file + ".tmp", stance_file)
+            else:
+                save_lines(stance_file, [])
+            print(f"[{input_file}] Saved stance analyses to {stance_file}")
+        print(f"[{input_file}] Saved {written[input_file]} analyses to {output_file}")
+
+    def source_units(input_file):
+        for unit in iter_units(enumerate(iter_jsonl(input_file), start=1)):
+            yield source_name(input_file), unit
+
+    units = {f: source_units(f) for f in jsonl_files}
+    await run_ordered(units, handle, write, finish)
+    # the technique streams are closed once every file is written, so waiting
+    # for their last calls never holds up the detection requests
+    for input_file in jsonl_files if categorize_techniques else []:
+        if input_file not in techniques:
+            techniques[input_file] = TechniqueStream(categorizer, technique_output_path(input_file))
+        close_techniques(input_file, techniques.pop(input_file))
+    engine.print_stats()
+
+# ----------------------------
+# Batch API Execution Section
+# ----------------------------
+
+def iter_batch_requests(jsonl_files):
+    for input_file in jsonl_files:
+        source = os.path.splitext(os.path.basename(input_file))[0]
+        # savings are counted when the results are written below
+        for entries, prompts in iter_units(enumerate(iter_jsonl(input_file), start=1), track=False):
+            max_tokens, options = unit_request(entries)
+            unit_id = f"{source}:{entries[0][0]}"
+            if len(entries) > 1:
+                unit_id += f"-{entries[-1][0]}"
+            for part, prompt in enumerate(prompts, start=1):
+                body = chat_body("gpt-4o-mini", SYSTEM_PROMPT, prompt, temperature=0, max_tokens=max_tokens, **options)
+                yield (unit_id if len(prompts) == 1 else f"{unit_id}:{part}"), body
+
+def iter_stance_requests(jsonl_files):
+    # The detection answers come from the cache filled by the detection batch
+    for input_file in jsonl_files:
+        source = os.path.splitext(os.path.basename(input_file))[0]
+        for entries, prompts in iter_units(enumerate(iter_jsonl(input_file), start=1), track=False):
+            for (idx, record, _, _), analysis in zip(entries, detect_weaponisation(entries, prompts)):
+                row = weaponised_row(idx, record, analysis, source_name(input_file))
+                if row is not None:
+                    body = chat_body("gpt-4o-mini", stance_stage.SYSTEM_PROMPT, stance_stage.build_prompt(row),
+                                     temperature=0, max_tokens=300)
+                    yield f"{source}:{idx}", body
+
+def analyze_files_batch(jsonl_files):
+    # The batch results land in the cache, so the regular writer below renders
+    # every analysis from cache hits; only failed requests are sent interactively
+    errors = run_batch(batch_client, iter_batch_requests(jsonl_files), batch_directory, cache)
+    if errors:
+        print(f"[!] {len(errors)} requests failed in the batch, sending them interactively")
+    if stance_mode == "stream":
+        # stance prompts need the detection answers, so they go in a second batch
+        errors = run_batch(batch_client, iter_stance_requests(jsonl_files), batch_directory + "_stance", cache)
+        if errors:
+            print(f"[!] {len(errors)} stance requests failed in the batch, sending them interactively")
+    for input_file in jsonl_files:
+        analyze_file(input_file)
+
+# ----------------------------
+# Packing Validation Section
 # ----------------------------
-# Threaded Execution Section
+
+def sample_records(jsonl_files, sample_size, seed):
+    # Fixed random sample of records across files, streamed in two passes
+    counts = [count_records(f) for f in jsonl_files]
+    rng = random.Random(seed)
+    chosen = set(rng.sample(range(sum(counts)), min(sample_size, sum(counts))))
+    position = 0
+    for input_file in jsonl_files:
+        for record in iter_jsonl(input_file):
+            if position in chosen:
+                yield position, record
+            position += 1
+
+def validate_packing(jsonl_files, sample_size=validation_sample_size, seed=validation_seed):
+    """
+    Judges the same fixed sample one record per request and packed, and
+    prints how often the judgments agree. Single-record answers of earlier
+    runs come from the cache.
+    """
+    jsonl_files = sorted(jsonl_files)
+    judgments = {}
+    for packed in (False, True):
+        units = iter_units(sample_records(jsonl_files, sample_size, seed), track=False, packed=packed)
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            futures = {executor.submit(detect_weaponisation, *unit): unit[0] for unit in units}
+            for future in concurrent.futures.as_completed(futures):
+                for (idx, _, _, _), analysis in zip(futures[future], future.result()):
+                    results[idx] = parse_judgment(analysis)["judgment"]
+        judgments[packed] = results
+    print_comparison(compare_judgments(judgments[False], judgments[True]))
+
+# ----------------------------
+# Execution Section
 # ----------------------------
 
 jsonl_files = [
@@ -169,9 +590,26 @@ jsonl_files = [
 ]
 
 
-with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-    future_to_file = {executor.submit(analyze_file, f): f for f in jsonl_files}
+if execution_mode == "async":
+    asyncio.run(analyze_files_async(jsonl_files))
+elif execution_mode == "batch":
+    analyze_files_batch(jsonl_files)
+elif execution_mode == "validate_packing":
+    validate_packing(jsonl_files)
+else:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        future_to_file = {executor.submit(analyze_file, f): f for f in jsonl_files}
+
+        for future in concurrent.futures.as_completed(future_to_file):
+            future.result()
 
-    for future in concurrent.futures.as_completed(future_to_file):
-        input_file, results = future.result()
-        save_analysis_result(input_file, results)
+if triage.records:
+    triage.print_stats()
+if compaction.records:
+    compaction.print_stats()
+if packing.requests:
+    packing.print_stats()
+if categorize_techniques:
+    categorizer.shutdown()
+    categorizer.print_stats()
+cache.print_stats()
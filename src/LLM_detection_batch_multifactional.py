@@ -2,37 +2,30 @@ import json
 from openai import OpenAI
 import os
 import sys
-import difflib
 import concurrent.futures
-import pandas as pd
 
 #sys.path.append('../')
 from utils import *
+from record_stream import iter_csv, save_lines
+from llm_cache import LLMCache, cached_chat_completion
 
 input_directory = "../csv_files"
 output_directory = "../txt_results_finegrained"
 os.makedirs(output_directory, exist_ok=True)
 
-
-client = OpenAI(api_key="your_openai_api_key_here")
+SYSTEM_PROMPT = "You are a neutral linguistic analysis expert focused on detecting weaponization of cultural heritage."
 
 
 def load_csv(filepath):
-    # Read CSV using pandas
-    df = pd.read_csv(filepath, encoding="utf-8")
-
-    # Normalize "Source" column
-    df["Source"] = df["Source"].apply(
-        lambda x: os.path.basename(x).replace("_enriched_subsampled.jsonl", "")
-    )
-
-    # Convert to list of dicts (matching original function’s output)
-    records = df.to_dict(orient="records")
-    return records
+    # Stream the CSV in chunks instead of materializing the whole DataFrame
+    for record in iter_csv(filepath):
+        # Normalize "Source" column
+        record["Source"] = os.path.basename(record["Source"]).replace("_enriched_subsampled.jsonl", "")
+        yield record
 
 
 
-def detect_weaponisation(record):
+def build_prompt(record):
     record_json = json.dumps(record, indent=2, ensure_ascii=False)
 
     prompt = f"""
@@ -88,56 +81,57 @@ Here is the input JSON:
 
 Your analysis:
 """
+    return prompt
 
+def detect_weaponisation(record, client, cache):
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a neutral linguistic analysis expert focused on detecting weaponization of cultural heritage."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0,
-            max_tokens=300
-        )
-        return response.choices[0].message.content.strip()
+        return cached_chat_completion(client, cache, "gpt-4o-mini", SYSTEM_PROMPT, build_prompt(record),
+                                      temperature=0, max_tokens=300)
     except Exception as e:
         return f"Error during API call: {e}"
 
-def analyze_file(input_file):
-    records = load_csv(input_file)
-    print(f"[{input_file}] Loaded {len(records)} records.")
-    results = []
+def analysis_output_path(file_path):
+    base_name = os.path.splitext(os.path.basename(file_path))[0].replace("_output", "")
+    return f"{output_directory}/{base_name}_finegrained_analysis.txt"
+
+def format_analysis(idx, record, analysis):
+    return f"Record {idx} (Version: {record.get('version', 'N/A')}):\n{analysis}\n{'-'*80}\n"
 
-    for idx, record in enumerate(records, start=1):
+def iter_analyses(input_file, client, cache):
+    for idx, record in enumerate(load_csv(input_file), start=1):
         #print(record)
         if record["Judgment"].lower() == "weaponised":
-            analysis = detect_weaponisation(record)
+            analysis = detect_weaponisation(record, client, cache)
             print(analysis)
-            results.append(f"Record {idx} (Version: {record.get('version', 'N/A')}):\n{analysis}\n{'-'*80}\n")
-            print(f"[{input_file}] Processed record {idx}/{len(records)}")
-    return (input_file, results)
+            yield format_analysis(idx, record, analysis)
+            print(f"[{input_file}] Processed record {idx}")
 
-def save_analysis_result(file_path, results):
-    base_name = os.path.splitext(os.path.basename(file_path))[0].replace("_output", "")
-    output_file = f"{output_directory}/{base_name}_finegrained_analysis.txt"
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.writelines(results)
-    print(f"[{file_path}] Saved analysis to {output_file}")
+def analyze_file(input_file, client, cache):
+    output_file = analysis_output_path(input_file)
+    count = save_lines(output_file, iter_analyses(input_file, client, cache))
+    print(f"[{input_file}] Saved {count} analyses to {output_file}")
+    return (input_file, count)
 
 # ----------------------------
 # Threaded Execution Section
 # ----------------------------
-
-csv_files = [
-    os.path.join(input_directory, f)
-    for f in os.listdir(input_directory)
-    if f.endswith(".csv")
-]
-
-
-with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-    future_to_file = {executor.submit(analyze_file, f): f for f in csv_files}
-
-    for future in concurrent.futures.as_completed(future_to_file):
-        input_file, results = future.result()
-        save_analysis_result(input_file, results)
+# LLM_detection_batch.py imports this module as the stance stage of
+# stance_mode = "stream" (with its own client and cache), so the client, the
+# cache and the CSV pass only exist when it runs as a script
+
+if __name__ == "__main__":
+    client = OpenAI(api_key="your_openai_api_key_here")
+    cache = LLMCache()
+    csv_files = [
+        os.path.join(input_directory, f)
+        for f in os.listdir(input_directory)
+        if f.endswith(".csv")
+    ]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        future_to_file = {executor.submit(analyze_file, f, client, cache): f for f in csv_files}
+
+        for future in concurrent.futures.as_completed(future_to_file):
+            future.result()
+
+    cache.print_stats()
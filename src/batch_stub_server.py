@@ -0,0 +1,159 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import email
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal local stand-in for the OpenAI Files + Batch endpoints, so batch mode
+# can be exercised offline:
+#   python batch_stub_server.py [port]
+#   client = OpenAI(api_key="stub", base_url="http://localhost:8089/v1")
+# Batches complete immediately with canned answers.
+
+port = 8089
+storage_directory = "../batch_stub_storage"
+
+stub_chat_answer = "**Judgment: Not Weaponised**\n\n**Explanation:** Stub response from the local batch server."
+stub_responses_answer = "Selective Omission"
+# Field values of structured answers (judgments.judgment_format); other fields
+# get the first value of their enum, 0 or an empty string / list
+stub_fields = {"judgment": "Not Weaponised", "stance": "None", "explanation": "Stub response.", "indicators": []}
+
+files = {}    # file id -> path on disk
+batches = {}  # batch id -> batch object
+
+
+def _stub_value(name, schema, ids):
+    # an instance of the JSON schema of a structured answer
+    kind = schema.get("type")
+    if kind == "object":
+        value = {key: _stub_value(key, sub, ids) for key, sub in schema.get("properties", {}).items()}
+        if "id" in value and ids:
+            value["id"] = ids[0]
+        return value
+    if kind == "array":
+        if schema.get("items", {}).get("type") == "object":
+            # one entry per record id of a packed prompt
+            return [_stub_value(name, schema["items"], [record_id]) for record_id in ids]
+        return []
+    if name in stub_fields and ("enum" not in schema or stub_fields[name] in schema["enum"]):
+        return stub_fields[name]
+    if "enum" in schema:
+        return schema["enum"][0]
+    return 0 if kind == "integer" else ""
+
+
+def _stub_response(url, body):
+    if url == "/v1/responses":
+        return {
+            "id": "resp_" + uuid.uuid4().hex,
+            "object": "response",
+            "model": body.get("model"),
+            "output": [{"type": "message", "role": "assistant",
+                        "content": [{"type": "output_text", "text": stub_responses_answer}]}],
+        }
+    answer = stub_chat_answer
+    if "response_format" in body:
+        # packed prompts list their records as JSON objects with an "id"
+        prompt = body["messages"][-1]["content"] if body.get("messages") else ""
+        ids = [int(i) for i in re.findall(r'(?<!\\)"id": (\d+)', prompt)]
+        answer = json.dumps(_stub_value(None, body["response_format"]["json_schema"]["schema"], ids))
+    return {
+        "id": "chatcmpl-" + uuid.uuid4().hex,
+        "object": "chat.completion",
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def _store_file(content, purpose):
+    file_id = "file-" + uuid.uuid4().hex
+    path = os.path.join(storage_directory, file_id)
+    with open(path, "wb") as f:
+        f.write(content)
+    files[file_id] = path
+    return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": file_id, "purpose": purpose, "status": "processed"}
+
+
+def _run_batch(input_file_id, endpoint):
+    lines = []
+    total = 0
+    with open(files[input_file_id], "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            total += 1
+            lines.append(json.dumps({
+                "id": "batch_req_" + uuid.uuid4().hex,
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex,
+                             "body": _stub_response(request["url"], request["body"])},
+                "error": None,
+            }, ensure_ascii=False))
+    output = _store_file(("\n".join(lines) + "\n").encode("utf-8"), "batch_output")
+    batch_id = "batch_" + uuid.uuid4().hex
+    batches[batch_id] = {
+        "id": batch_id, "object": "batch", "endpoint": endpoint, "input_file_id": input_file_id,
+        "completion_window": "24h", "status": "completed", "created_at": int(time.time()),
+        "output_file_id": output["id"], "error_file_id": None,
+        "request_counts": {"total": total, "completed": total, "failed": 0},
+    }
+    return batches[batch_id]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        if self.path == "/v1/files":
+            # multipart/form-data upload: a "purpose" field and a "file" field
+            raw = self._read_body()
+            message = email.message_from_bytes(
+                b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + raw
+            )
+            fields = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                      for part in message.get_payload()}
+            self._send_json(_store_file(fields["file"], fields.get("purpose", b"batch").decode()))
+        elif self.path == "/v1/batches":
+            request = json.loads(self._read_body())
+            self._send_json(_run_batch(request["input_file_id"], request["endpoint"]))
+        else:
+            self._send_json({"error": {"message": f"Unknown endpoint {self.path}"}}, 404)
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in batches:
+            self._send_json(batches[parts[2]])
+        elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in files:
+            with open(files[parts[2]], "rb") as f:
+                body = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json({"error": {"message": f"Unknown endpoint {self.path}"}}, 404)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    os.makedirs(storage_directory, exist_ok=True)
+    print(f"[✓] Batch stub server on http://localhost:{port}/v1")
+    ThreadingHTTPServer(("localhost", port), StubHandler).serve_forever()
@@ -0,0 +1,268 @@
+import os
+import csv
+import json
+import time
+import shutil
+import argparse
+from collections import Counter
+
+import numpy as np
+
+from embedding_store import EmbeddingStore, default_model, text_key
+
+# Relative to src/
+model_directory = "../cluster_model"
+output_directory = "../data"
+# Same settings as clustering.ipynb / clustering_pipeline.py
+n_neighbors = 40
+n_components = 15
+metric = "cosine"
+min_cluster_size = 20
+random_state = 42
+# Refit once the outlier rate of the revisions assigned since the fit exceeds
+# the one of the fit by this much, judged after at least min_drift_texts of them
+max_outlier_drift = 0.10
+min_drift_texts = 100
+
+ASSIGNMENT_COLUMNS = ["key", "Cluster", "probability", "fit"]
+
+
+# ----------------------------
+# Incremental cluster assignment
+# ----------------------------
+# The UMAP reducer and the HDBSCAN model (with prediction data) of the last
+# full fit are kept in model_directory, with the assignment of every text
+# seen so far (assignments.csv). New texts are only projected with
+# reducer.transform and placed with hdbscan.approximate_predict, so an update
+# costs O(new texts) and cluster ids do not move. A full refit happens when
+# the texts assigned since the fit (counted in meta.json across updates) fall
+# outside the clusters markedly more often than the fitted ones did; its clusters then take over the ids of the old clusters they
+# overlap most, so the named clusters and taxonomy mappings keep their ids.
+
+class ClusterModel:
+    def __init__(self, directory=model_directory, max_outlier_drift=max_outlier_drift,
+                 min_drift_texts=min_drift_texts):
+        self.directory = directory
+        self.max_outlier_drift = max_outlier_drift
+        self.min_drift_texts = min_drift_texts
+        self.reducer = None
+        self.clusterer = None
+        self.meta = None
+        self.assignments = {}  # text key -> (stable cluster id, probability, fit number)
+        self.assigned = 0
+        self.refits = 0
+        self._assignments_path = os.path.join(directory, "assignments.csv")
+        self._load()
+
+    def _load(self):
+        meta_path = os.path.join(self.directory, "meta.json")
+        if not os.path.exists(self.directory) and os.path.exists(self.directory + ".old"):
+            # a crash between the two renames of fit() leaves the old model aside
+            os.replace(self.directory + ".old", self.directory)
+        if not os.path.exists(meta_path):
+            return
+        import joblib
+
+        with open(meta_path, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.reducer = joblib.load(os.path.join(self.directory, "reducer.joblib"))
+        self.clusterer = joblib.load(os.path.join(self.directory, "clusterer.joblib"))
+        if os.path.exists(self._assignments_path):
+            with open(self._assignments_path, "r", newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    self.assignments[row["key"]] = (int(row["Cluster"]), float(row["probability"]), int(row["fit"]))
+
+    @property
+    def fitted(self):
+        return self.meta is not None
+
+    def __contains__(self, key):
+        return key in self.assignments
+
+    def _stable_ids(self, labels, keys):
+        """
+        Returns: dict HDBSCAN label -> stable cluster id, each new cluster taking
+        the id of the old cluster most of its (already assigned) texts were in,
+        largest overlaps first; clusters without one get fresh ids.
+        """
+        overlaps = Counter()
+        for label, key in zip(labels, keys):
+            old = self.assignments.get(key)
+            if label != -1 and old is not None and old[0] != -1:
+                overlaps[(int(label), old[0])] += 1
+        mapping = {-1: -1}
+        taken = set()
+        for (label, old_id), _ in overlaps.most_common():
+            if label not in mapping and old_id not in taken:
+                mapping[label] = old_id
+                taken.add(old_id)
+        next_id = max([self.meta["next_id"] if self.meta else 0] + [i + 1 for i in taken])
+        for label in sorted(set(int(l) for l in labels) - set(mapping)):
+            mapping[label] = next_id
+            next_id += 1
+        return mapping, next_id
+
+    def fit(self, embeddings, keys):
+        """
+        Full UMAP + HDBSCAN fit on every text; replaces the stored model and
+        assignments.
+        """
+        import umap
+        import hdbscan
+        import joblib
+
+        start = time.time()
+        reducer = umap.UMAP(n_neighbors=n_neighbors, n_components=n_components, metric=metric,
+                            random_state=random_state)
+        reduced = reducer.fit_transform(embeddings)
+        clusterer = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, metric="euclidean", prediction_data=True)
+        labels = clusterer.fit_predict(reduced)
+        mapping, next_id = self._stable_ids(labels, keys)
+
+        fit_number = self.meta["fit"] + 1 if self.meta else 1
+        self.meta = {
+            "fit": fit_number,
+            "texts": len(keys),
+            "outlier_rate": float(np.mean(labels == -1)),
+            # texts placed by assign() since this fit, and how many of them were outliers
+            "assigned_since_fit": 0,
+            "outliers_since_fit": 0,
+            "label_map": {str(label): stable for label, stable in mapping.items()},
+            "next_id": next_id,
+            "params": {"n_neighbors": n_neighbors, "n_components": n_components, "metric": metric,
+                       "min_cluster_size": min_cluster_size, "random_state": random_state},
+        }
+        self.reducer, self.clusterer = reducer, clusterer
+        self.assignments = {key: (mapping[int(label)], float(p), fit_number)
+                            for key, label, p in zip(keys, labels, clusterer.probabilities_)}
+
+        # written next to the old model and swapped in, so a crash leaves one or the other
+        tmp_directory = self.directory + ".tmp"
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        os.makedirs(tmp_directory)
+        joblib.dump(reducer, os.path.join(tmp_directory, "reducer.joblib"))
+        joblib.dump(clusterer, os.path.join(tmp_directory, "clusterer.joblib"))
+        self._write_meta(tmp_directory)
+        self._write_assignments(os.path.join(tmp_directory, "assignments.csv"), list(self.assignments), "w")
+        old_directory = self.directory + ".old"
+        shutil.rmtree(old_directory, ignore_errors=True)
+        if os.path.exists(self.directory):
+            os.replace(self.directory, old_directory)
+        os.replace(tmp_directory, self.directory)
+        shutil.rmtree(old_directory, ignore_errors=True)
+        self.refits += 1
+        print(f"[assign] fit {fit_number}: {len(keys)} texts, {len(set(labels)) - (1 if -1 in labels else 0)} "
+              f"clusters, {self.meta['outlier_rate']:.1%} outliers ({time.time() - start:.1f}s)")
+
+    def _write_meta(self, directory):
+        tmp_path = os.path.join(directory, "meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp_path, os.path.join(directory, "meta.json"))
+
+    def _write_assignments(self, path, keys, mode):
+        new_file = mode == "w" or not os.path.exists(path)
+        with open(path, mode, newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(ASSIGNMENT_COLUMNS)
+            for key in keys:
+                cluster, probability, fit_number = self.assignments[key]
+                writer.writerow([key, cluster, f"{probability:.4f}", fit_number])
+
+    def assign(self, embeddings, keys):
+        """
+        Places new texts into the fitted clusters without refitting.
+
+        Returns: outlier rate of the new texts.
+        """
+        import hdbscan
+
+        reduced = self.reducer.transform(embeddings)
+        labels, strengths = hdbscan.approximate_predict(self.clusterer, reduced)
+        label_map = self.meta["label_map"]
+        for key, label, strength in zip(keys, labels, strengths):
+            self.assignments[key] = (label_map[str(int(label))], float(strength), self.meta["fit"])
+        self._write_assignments(self._assignments_path, keys, "a")
+        outliers = int(np.sum(labels == -1))
+        self.meta["assigned_since_fit"] = self.meta.get("assigned_since_fit", 0) + len(keys)
+        self.meta["outliers_since_fit"] = self.meta.get("outliers_since_fit", 0) + outliers
+        self._write_meta(self.directory)
+        self.assigned += len(keys)
+        return outliers / len(keys)
+
+    def update(self, store, texts):
+        """
+        store: an EmbeddingStore with (or able to encode) the texts
+        texts: every analysis text of the corpus
+
+        Assigns the texts not seen yet; fits from scratch when there is no
+        model or, once min_drift_texts were assigned since the fit, their
+        outlier rate drifted past max_outlier_drift.
+        """
+        keys = [text_key(text) for text in texts]
+        if not self.fitted:
+            self.fit(store.encode(texts), keys)
+            return
+        new = {}
+        for key, text in zip(keys, texts):
+            if key not in self.assignments and key not in new:
+                new[key] = text
+        if not new:
+            print(f"[assign] no new texts (fit {self.meta['fit']})")
+            return
+        start = time.time()
+        outlier_rate = self.assign(store.encode(list(new.values())), list(new))
+        since_fit = self.meta["assigned_since_fit"]
+        drift_rate = self.meta["outliers_since_fit"] / since_fit
+        print(f"[assign] {len(new)} new texts assigned, {outlier_rate:.1%} outliers; {since_fit} since the fit, "
+              f"{drift_rate:.1%} outliers (fit: {self.meta['outlier_rate']:.1%}) in {time.time() - start:.1f}s")
+        if since_fit >= self.min_drift_texts and drift_rate - self.meta["outlier_rate"] > self.max_outlier_drift:
+            print(f"[assign] outlier rate drifted by more than {self.max_outlier_drift:.0%}, refitting")
+            self.fit(store.encode(texts), keys)
+
+    def labels(self, texts):
+        # stable cluster id of every (assigned) text
+        return np.array([self.assignments[text_key(text)][0] for text in texts])
+
+    def print_stats(self):
+        fit = self.meta["fit"] if self.meta else 0
+        print(f"[assign] {len(self.assignments)} texts assigned (fit {fit}), {self.assigned} incrementally this "
+              f"run, {self.refits} refits")
+
+
+def write_clusters(texts, labels, output_path):
+    # revision_clusters_sorted.csv with the stable ids (lemmas from the lemma cache)
+    from lemmatization import lemmatize_texts
+
+    df = texts.assign(lemmatized_text=lemmatize_texts(texts["original_text"]), Cluster=labels)
+    df = df[df["Cluster"] != -1].sort_values("Cluster", kind="stable")
+    df[["Cluster", "source", "lemmatized_text", "original_text"]].to_csv(output_path, index=False, encoding="utf-8")
+    print(f"[assign] {len(df)} clustered revisions written to {output_path}")
+
+
+if __name__ == "__main__":
+    from clustering_pipeline import load_texts
+
+    parser = argparse.ArgumentParser(description="Assign new weaponised revisions to the existing clusters, "
+                                                 "refitting only when they no longer fit.")
+    parser.add_argument("--input-dir", default="../csv_files")
+    parser.add_argument("--output", default=os.path.join(output_directory, "revision_clusters_sorted.csv"))
+    parser.add_argument("--model", default=default_model, help="SentenceTransformer model")
+    parser.add_argument("--max-outlier-drift", type=float, default=max_outlier_drift)
+    parser.add_argument("--min-drift-texts", type=int, default=min_drift_texts,
+                        help="new texts assigned since the fit before drift can trigger a refit")
+    parser.add_argument("--refit", action="store_true", help="full fit regardless of drift")
+    args = parser.parse_args()
+
+    texts = load_texts(args.input_dir)
+    store = EmbeddingStore(args.model)
+    model = ClusterModel(max_outlier_drift=args.max_outlier_drift, min_drift_texts=args.min_drift_texts)
+    corpus = list(texts["original_text"])
+    if args.refit:
+        model.fit(store.encode(corpus), [text_key(text) for text in corpus])
+    else:
+        model.update(store, corpus)
+    write_clusters(texts, model.labels(corpus), args.output)
+    store.print_stats()
+    model.print_stats()
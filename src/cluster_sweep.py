@@ -0,0 +1,190 @@
+import os
+import csv
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+# Relative to src/ and notebooks/ alike
+sweep_directory = "../cluster_sweep"
+n_neighbors_list = [10, 20, 30, 40, 50, 60, 80, 120]
+n_components_list = [5, 10, 15, 20]
+min_cluster_size = 20
+metric = "cosine"
+random_state = 42
+# Points (across clusters, in proportion) the silhouette is computed on
+silhouette_sample_size = 5000
+num_workers = os.cpu_count() or 4
+
+RESULT_COLUMNS = ["data", "n_neighbors", "n_components", "min_cluster_size", "metric", "num_clusters",
+                  "noise_points", "noise_fraction", "silhouette", "dbcv", "avg_persistence", "seconds"]
+
+
+# ----------------------------
+# UMAP x HDBSCAN hyperparameter sweep
+# ----------------------------
+# The nearest-neighbor search is the part of a UMAP fit that only depends on
+# n_neighbors, so it is done once, for the largest n_neighbors of the sweep,
+# and every configuration gets the first n_neighbors columns of it. The
+# configurations then run on a process pool, and each finished one is
+# appended to a results table, so an interrupted sweep resumes where it
+# stopped.
+
+def data_key(embeddings):
+    # identifies the embeddings a result row or kNN graph belongs to
+    return hashlib.sha1(np.ascontiguousarray(embeddings).tobytes()).hexdigest()[:12]
+
+
+def knn_graph(embeddings, n_neighbors, key, metric=metric):
+    """
+    Returns: path of an .npz with the indices and distances of the
+    n_neighbors (or more) nearest neighbors of every point, computed once per
+    embeddings and metric.
+    """
+    path = os.path.join(sweep_directory, f"knn_{key}_{metric}.npz")
+    if os.path.exists(path):
+        with np.load(path) as knn:
+            if knn["indices"].shape[1] >= n_neighbors:
+                return path
+    from umap.umap_ import nearest_neighbors
+
+    start = time.time()
+    indices, dists, _ = nearest_neighbors(embeddings, n_neighbors, metric, {}, False,
+                                          np.random.RandomState(random_state))
+    np.savez(path, indices=indices, dists=dists)
+    print(f"[sweep] {n_neighbors}-NN graph of {len(embeddings)} points in {time.time() - start:.1f}s")
+    return path
+
+
+def stratified_sample(labels, size, seed=random_state):
+    """
+    Returns: sorted indices of about size points, every label represented in
+    proportion to its count (at least 2 points each); all points when there
+    are no more than size.
+    """
+    if len(labels) <= size:
+        return np.arange(len(labels))
+    rng = np.random.default_rng(seed)
+    picked = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        count = max(2, round(size * len(members) / len(labels)))
+        picked.append(rng.choice(members, min(count, len(members)), replace=False))
+    return np.sort(np.concatenate(picked))
+
+
+_worker_data = {}
+
+
+def _init_worker(embeddings_path, knn_path):
+    # loaded once per worker process rather than pickled with every job
+    _worker_data["embeddings"] = np.load(embeddings_path, mmap_mode="r")
+    with np.load(knn_path) as knn:
+        _worker_data["indices"] = knn["indices"]
+        _worker_data["dists"] = knn["dists"]
+
+
+def evaluate_config(n_neighbors, n_components, min_cluster_size=min_cluster_size, metric=metric,
+                    sample_size=silhouette_sample_size):
+    """
+    Fits UMAP + HDBSCAN for one configuration in a worker.
+
+    Returns: dict with the result columns (but "data").
+    """
+    import umap
+    import hdbscan
+    from sklearn.metrics import silhouette_score
+
+    start = time.time()
+    knn = (_worker_data["indices"][:, :n_neighbors], _worker_data["dists"][:, :n_neighbors], None)
+    reducer = umap.UMAP(n_neighbors=n_neighbors, n_components=n_components, metric=metric,
+                        random_state=random_state, precomputed_knn=knn)
+    reduced = reducer.fit_transform(np.asarray(_worker_data["embeddings"]))
+
+    # the minimum spanning tree is needed for relative_validity_ (DBCV)
+    clusterer = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, metric="euclidean", gen_min_span_tree=True)
+    labels = clusterer.fit_predict(reduced)
+    mask = labels != -1
+    num_clusters = len(np.unique(labels[mask]))
+    silhouette = dbcv = np.nan
+    if num_clusters > 1:
+        sample = stratified_sample(labels[mask], sample_size)
+        silhouette = silhouette_score(reduced[mask][sample], labels[mask][sample])
+        dbcv = clusterer.relative_validity_
+    return {
+        "n_neighbors": n_neighbors,
+        "n_components": n_components,
+        "min_cluster_size": min_cluster_size,
+        "metric": metric,
+        "num_clusters": num_clusters,
+        "noise_points": int(np.sum(~mask)),
+        "noise_fraction": float(np.mean(~mask)),
+        "silhouette": float(silhouette),
+        "dbcv": float(dbcv),
+        "avg_persistence": float(np.mean(clusterer.cluster_persistence_)) if num_clusters else np.nan,
+        "seconds": round(time.time() - start, 1),
+    }
+
+
+def _done_configs(results_path, key):
+    if not os.path.exists(results_path):
+        return set()
+    done = pd.read_csv(results_path)
+    done = done[done["data"] == key]
+    return set(zip(done["n_neighbors"], done["n_components"], done["min_cluster_size"], done["metric"]))
+
+
+def _append_result(results_path, row):
+    new_file = not os.path.exists(results_path)
+    with open(results_path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+        if new_file:
+            writer.writeheader()
+        writer.writerow(row)
+
+
+def run_sweep(embeddings, n_neighbors_list=n_neighbors_list, n_components_list=n_components_list,
+              min_cluster_size=min_cluster_size, metric=metric, results_path=None):
+    """
+    embeddings: array (texts, dim), e.g. from embedding_store.EmbeddingStore.encode
+
+    Returns: DataFrame with one row per configuration of the grid, including
+    the ones finished by earlier runs on the same embeddings.
+    """
+    os.makedirs(sweep_directory, exist_ok=True)
+    results_path = results_path or os.path.join(sweep_directory, "results.csv")
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    key = data_key(embeddings)
+
+    grid = [(n, c) for n in n_neighbors_list for c in n_components_list]
+    done = _done_configs(results_path, key)
+    todo = [(n, c) for n, c in grid if (n, c, min_cluster_size, metric) not in done]
+    print(f"[sweep] {len(todo)} of {len(grid)} configurations to run ({len(grid) - len(todo)} already in "
+          f"{results_path})")
+
+    if todo:
+        started = time.time()
+        embeddings_path = os.path.join(sweep_directory, f"embeddings_{key}.npy")
+        if not os.path.exists(embeddings_path):
+            np.save(embeddings_path, embeddings)
+        knn_path = knn_graph(embeddings, max(n for n, _ in todo), key, metric)
+        # slowest (largest) configurations first, so none of them finishes last alone
+        todo.sort(reverse=True)
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                                 initargs=(embeddings_path, knn_path)) as executor:
+            futures = [executor.submit(evaluate_config, n, c, min_cluster_size, metric) for n, c in todo]
+            for future in as_completed(futures):
+                row = {"data": key, **future.result()}
+                _append_result(results_path, row)
+                print(f"[sweep] n_neighbors={row['n_neighbors']} n_components={row['n_components']}: "
+                      f"{row['num_clusters']} clusters, {row['noise_fraction']:.1%} noise, "
+                      f"silhouette {row['silhouette']:.3f}, DBCV {row['dbcv']:.3f} ({row['seconds']}s)")
+        print(f"[sweep] {len(todo)} configurations in {time.time() - started:.1f}s")
+
+    results = pd.read_csv(results_path)
+    results = results[(results["data"] == key) & (results["min_cluster_size"] == min_cluster_size)
+                      & (results["metric"] == metric)]
+    grid = set(grid)
+    return results[[(n, c) in grid for n, c in zip(results["n_neighbors"], results["n_components"])]]
@@ -0,0 +1,145 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from lemmatization import custom_stopwords
+from keyword_extraction import ngram_columns
+
+# Relative to src/
+output_directory = "../data"
+top_n_words = 10
+# As in the clustering notebook these scripts replace (the "3-grams" column stays empty)
+ngram_range = (1, 2)
+# Smaller clusters get no topic model of their own
+min_topic_documents = 10
+random_state = 42
+num_workers = os.cpu_count() or 4
+
+TOPIC_COLUMNS = ["Topic", "Num_Documents", "1-grams", "2-grams", "3-grams"]
+
+
+# ----------------------------
+# BERTopic on precomputed embeddings
+# ----------------------------
+# The texts are never encoded again: BERTopic gets the rows of the embedding
+# matrix (EmbeddingStore.encode) and no embedding model, so worker processes
+# do not load the SentenceTransformer either. Per-cluster models are
+# independent and fitted on a process pool, largest clusters first.
+
+def fit_topics(texts, embeddings, top_n_words=top_n_words, ngram_range=ngram_range, random_state=random_state):
+    """
+    Returns: (topic of every text, DataFrame (Topic, Num_Documents, n-gram
+    columns)) of a BERTopic model fitted on the texts and their embeddings.
+    """
+    from bertopic import BERTopic
+    from umap import UMAP
+    from sklearn.feature_extraction.text import CountVectorizer, ENGLISH_STOP_WORDS
+
+    vectorizer_model = CountVectorizer(stop_words=list(ENGLISH_STOP_WORDS.union(custom_stopwords)),
+                                       ngram_range=ngram_range)
+    # BERTopic's default UMAP, seeded so that a rerun gives the same topics
+    umap_model = UMAP(n_neighbors=15, n_components=5, min_dist=0.0, metric="cosine", random_state=random_state)
+    topic_model = BERTopic(embedding_model=None, umap_model=umap_model, vectorizer_model=vectorizer_model,
+                           top_n_words=top_n_words, calculate_probabilities=False, verbose=False)
+    topics, _ = topic_model.fit_transform(list(texts), np.asarray(embeddings))
+    rows = []
+    for row in topic_model.get_topic_info().itertuples():
+        if row.Topic == -1:
+            continue  # outliers
+        words = [word for word, _ in topic_model.get_topic(row.Topic)]
+        rows.append({"Topic": row.Topic, "Num_Documents": row.Count, **ngram_columns(words)})
+    return np.asarray(topics), pd.DataFrame(rows, columns=TOPIC_COLUMNS)
+
+
+def _fit_cluster(label, texts, embeddings, top_n_words, ngram_range):
+    # runs in a worker process
+    start = time.time()
+    topics, table = fit_topics(texts, embeddings, top_n_words, ngram_range)
+    return label, topics, table, time.time() - start
+
+
+def per_cluster_topics(texts, embeddings, labels, top_n_words=top_n_words, ngram_range=ngram_range,
+                       min_documents=min_topic_documents, num_workers=num_workers):
+    """
+    texts: text of every row
+    embeddings: embedding matrix, one row per text
+    labels: cluster label of every text (-1 = noise)
+
+    Returns: (topic of every text within its cluster, -1 when it has none;
+    DataFrame (Cluster, Topic, Num_Documents, n-gram columns)).
+    """
+    texts = np.asarray(texts, dtype=object)
+    labels = np.asarray(labels)
+    topics = np.full(len(labels), -1)
+    clusters = [(label, np.flatnonzero(labels == label)) for label in np.unique(labels) if label != -1]
+    clusters = [(label, members) for label, members in clusters if len(members) >= min_documents]
+    clusters.sort(key=lambda cluster: -len(cluster[1]))
+
+    start = time.time()
+    tables = {}
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {executor.submit(_fit_cluster, int(label), list(texts[members]), embeddings[members], top_n_words,
+                                   ngram_range): (label, members) for label, members in clusters}
+        for future in as_completed(futures):
+            label, members = futures[future]
+            try:
+                _, member_topics, table, seconds = future.result()
+            except (ValueError, TypeError) as e:
+                # e.g. a cluster too small for BERTopic's UMAP / HDBSCAN
+                print(f"[!] Cluster {label}: no topics ({e})")
+                continue
+            topics[members] = member_topics
+            tables[int(label)] = table.assign(Cluster=int(label))
+            print(f"[topics] cluster {label}: {len(members)} texts, {len(table)} topics in {seconds:.1f}s")
+    print(f"[topics] {len(tables)} of {len(clusters)} clusters fitted in {time.time() - start:.1f}s")
+
+    columns = ["Cluster"] + TOPIC_COLUMNS
+    if not tables:
+        return topics, pd.DataFrame(columns=columns)
+    return topics, pd.concat([tables[label] for label in sorted(tables)], ignore_index=True)[columns]
+
+
+def write_cluster_topics(revisions, labels, topics, table, output_dir=output_directory):
+    """
+    revisions: DataFrame (source, lemmatized_text, original_text), one row per text
+
+    Writes bertopic_per_cluster_topic_assignments_sorted.csv and
+    keywords/cluster_topics_per_cluster_bertopic_sorted.csv.
+    """
+    os.makedirs(os.path.join(output_dir, "keywords"), exist_ok=True)
+    labels, topics = np.asarray(labels), np.asarray(topics)
+    assignments = revisions.assign(Cluster=labels, Topic=topics)[(labels != -1) & (topics != -1)]
+    assignments = assignments.sort_values(["Cluster", "Topic"], kind="stable")[
+        ["Cluster", "Topic", "source", "lemmatized_text", "original_text"]]
+    assignments.to_csv(os.path.join(output_dir, "bertopic_per_cluster_topic_assignments_sorted.csv"), index=False,
+                       encoding="utf-8")
+    table.to_csv(os.path.join(output_dir, "keywords", "cluster_topics_per_cluster_bertopic_sorted.csv"), index=False,
+                 encoding="utf-8")
+    return len(assignments)
+
+
+if __name__ == "__main__":
+    from embedding_store import EmbeddingStore, default_model
+
+    parser = argparse.ArgumentParser(description="Fit one BERTopic model per cluster of "
+                                                 "revision_clusters_sorted.csv, in parallel.")
+    parser.add_argument("--clusters", default=os.path.join(output_directory, "revision_clusters_sorted.csv"))
+    parser.add_argument("--output-dir", default=output_directory)
+    parser.add_argument("--model", default=default_model, help="SentenceTransformer model of the stored embeddings")
+    parser.add_argument("--top-n-words", type=int, default=top_n_words)
+    parser.add_argument("--min-documents", type=int, default=min_topic_documents)
+    parser.add_argument("--workers", type=int, default=num_workers)
+    args = parser.parse_args()
+
+    revisions = pd.read_csv(args.clusters, encoding="utf-8", keep_default_na=False)
+    store = EmbeddingStore(args.model)
+    embeddings = store.encode(revisions["original_text"])
+    topics, table = per_cluster_topics(revisions["original_text"], embeddings, revisions["Cluster"],
+                                       args.top_n_words, min_documents=args.min_documents, num_workers=args.workers)
+    count = write_cluster_topics(revisions, revisions["Cluster"], topics, table, args.output_dir)
+    print(f"[topics] {count} per-cluster topic assignments written to {args.output_dir}")
+    store.print_stats()
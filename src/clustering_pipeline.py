@@ -0,0 +1,293 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+from embedding_store import EmbeddingStore, default_model
+from lemmatization import lemmatize_texts, custom_stopwords, spacy_model, n_process
+from keyword_extraction import cluster_keywords
+from cluster_topics import fit_topics, per_cluster_topics, write_cluster_topics, num_workers
+
+# Relative to src/
+input_directory = "../csv_files"
+output_directory = "../data"
+work_directory = "../pipeline_cache"
+
+
+# ----------------------------
+# Checkpointed stages
+# ----------------------------
+# Every stage writes its artifacts into work_directory/<stage>_<key>, where key
+# hashes the stage's parameters and the keys of the artifacts it reads. A
+# stage whose directory exists is skipped, so changing e.g. the keyword
+# settings only reruns the keyword stage, and going back to earlier settings
+# reuses their artifacts.
+
+def _rss_bytes():
+    # current resident memory (Linux), else the process peak so far
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakMemory:
+    # Samples the resident memory in a thread while the block runs, so memory
+    # allocated outside Python (numpy, torch, numba) is counted as well
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+def artifact_key(name, parts):
+    payload = json.dumps([name, parts], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class Pipeline:
+    def __init__(self, work_dir=work_directory, force=()):
+        self.work_dir = work_dir
+        self.force = set(force)
+        self.report = []  # (stage, seconds, peak bytes or None when skipped)
+        os.makedirs(work_dir, exist_ok=True)
+
+    def timed(self, name, fn, *args):
+        with PeakMemory() as memory:
+            start = time.time()
+            result = fn(*args)
+        self.report.append((name, time.time() - start, memory.peak))
+        return result
+
+    def stage(self, name, parts, compute):
+        """
+        parts: everything the artifacts depend on (parameters, upstream paths)
+        compute: fn(directory) writing the artifacts into directory
+
+        Returns: the artifact directory.
+        """
+        path = os.path.join(self.work_dir, f"{name}_{artifact_key(name, parts)}")
+        if os.path.isdir(path) and name not in self.force:
+            print(f"[{name}] up to date ({os.path.basename(path)})")
+            self.report.append((name, 0.0, None))
+            return path
+        print(f"[{name}] running")
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        self.timed(name, compute, tmp_path)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        return path
+
+    def print_report(self):
+        print(f"[pipeline] {'stage':16} {'seconds':>9} {'peak RSS':>10}")
+        for name, seconds, peak in self.report:
+            memory = f"{peak / 1024 ** 2:.0f} MB" if peak is not None else "skipped"
+            print(f"[pipeline] {name:16} {seconds:9.1f} {memory:>10}")
+
+
+# ----------------------------
+# Stage implementations
+# ----------------------------
+
+def load_texts(input_dir):
+    """
+    Returns: DataFrame (source, original_text) with the analyses of the
+    weaponised records of every *_output.csv, in file name order.
+    """
+    frames = []
+    for filename in sorted(os.listdir(input_dir)):
+        if filename.endswith("_output.csv"):
+            df = pd.read_csv(os.path.join(input_dir, filename), encoding="utf-8")
+            df = df[df["Judgment"] == "Weaponised"]
+            texts = df["Analysis"].dropna().astype(str)
+            frames.append(pd.DataFrame({"source": filename.replace("_output.csv", ""), "original_text": texts}))
+    if not frames:
+        return pd.DataFrame(columns=["source", "original_text"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def texts_key(texts):
+    # content hash of the loaded texts: every later key derives from it
+    digest = hashlib.sha256()
+    for source, text in zip(texts["source"], texts["original_text"]):
+        digest.update(f"{source}\0{text}\0".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def reduce_embeddings(embeddings, n_neighbors, n_components, metric, random_state):
+    import umap
+
+    reducer = umap.UMAP(n_neighbors=n_neighbors, n_components=n_components, metric=metric, random_state=random_state)
+    return reducer.fit_transform(embeddings)
+
+
+def cluster_points(reduced, min_cluster_size):
+    import hdbscan
+
+    return hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, metric="euclidean").fit_predict(reduced)
+
+
+# ----------------------------
+# Pipeline
+# ----------------------------
+
+def run(args):
+    pipeline = Pipeline(args.work_dir, force=args.force)
+    texts = pipeline.timed("load", load_texts, args.input_dir)
+    print(f"[load] {len(texts)} weaponised analyses from {args.input_dir}")
+    key = texts_key(texts)
+    store = EmbeddingStore(args.model)
+
+    def write_texts(path):
+        texts.to_csv(os.path.join(path, "texts.csv"), index=False, encoding="utf-8")
+    texts_dir = pipeline.stage("texts", [key], write_texts)
+
+    def compute_lemmas(path):
+        with open(os.path.join(path, "lemmas.json"), "w", encoding="utf-8") as f:
+            json.dump(lemmatize_texts(texts["original_text"], args.spacy_model, n_process=args.n_process), f,
+                      ensure_ascii=False)
+    lemmas_dir = pipeline.stage("lemmas", [texts_dir, args.spacy_model, sorted(custom_stopwords)], compute_lemmas)
+
+    def compute_embeddings(path):
+        np.save(os.path.join(path, "embeddings.npy"), store.encode(texts["original_text"]))
+    embeddings_dir = pipeline.stage("embeddings", [texts_dir, args.model], compute_embeddings)
+
+    def compute_reduced(path):
+        embeddings = np.load(os.path.join(embeddings_dir, "embeddings.npy"))
+        reduced = reduce_embeddings(embeddings, args.n_neighbors, args.n_components, args.metric, args.random_state)
+        np.save(os.path.join(path, "reduced.npy"), reduced)
+    reduced_dir = pipeline.stage("umap", [embeddings_dir, args.n_neighbors, args.n_components, args.metric,
+                                          args.random_state], compute_reduced)
+
+    def compute_labels(path):
+        labels = cluster_points(np.load(os.path.join(reduced_dir, "reduced.npy")), args.min_cluster_size)
+        np.save(os.path.join(path, "labels.npy"), labels)
+    labels_dir = pipeline.stage("hdbscan", [reduced_dir, args.min_cluster_size], compute_labels)
+
+    with open(os.path.join(lemmas_dir, "lemmas.json"), "r", encoding="utf-8") as f:
+        lemmas = json.load(f)
+    labels = np.load(os.path.join(labels_dir, "labels.npy"))
+    print(f"[hdbscan] {len(set(labels)) - (1 if -1 in labels else 0)} clusters (excluding noise)")
+
+    def compute_keywords(path):
+        embeddings = np.load(os.path.join(embeddings_dir, "embeddings.npy"))
+        table = cluster_keywords(labels, lemmas, embeddings, store, top_n=args.keywords_top_n,
+                                 candidates=args.keywords_candidates, diversity=args.keywords_diversity,
+                                 min_df=args.keywords_min_df)
+        table.to_csv(os.path.join(path, "cluster_keywords.csv"), index=False, encoding="utf-8")
+    keywords_dir = pipeline.stage("keywords", [labels_dir, lemmas_dir, embeddings_dir, args.keywords_top_n,
+                                               args.keywords_candidates, args.keywords_diversity,
+                                               args.keywords_min_df, sorted(custom_stopwords)], compute_keywords)
+
+    def compute_general_topics(path):
+        embeddings = np.load(os.path.join(embeddings_dir, "embeddings.npy"))
+        topics, table = fit_topics(texts["original_text"], embeddings, args.topics_top_n,
+                                   random_state=args.random_state)
+        np.save(os.path.join(path, "topics.npy"), topics)
+        table.to_csv(os.path.join(path, "topics.csv"), index=False, encoding="utf-8")
+    general_dir = pipeline.stage("general_topics", [embeddings_dir, args.topics_top_n, args.random_state,
+                                                    sorted(custom_stopwords)], compute_general_topics)
+
+    def compute_cluster_topics(path):
+        embeddings = np.load(os.path.join(embeddings_dir, "embeddings.npy"))
+        topics, table = per_cluster_topics(texts["original_text"], embeddings, labels, args.topics_top_n,
+                                           min_documents=args.min_topic_documents, num_workers=args.workers)
+        np.save(os.path.join(path, "topics.npy"), topics)
+        table.to_csv(os.path.join(path, "topics.csv"), index=False, encoding="utf-8")
+    cluster_topics_dir = pipeline.stage("cluster_topics", [labels_dir, embeddings_dir, args.topics_top_n,
+                                                           args.min_topic_documents, sorted(custom_stopwords)],
+                                        compute_cluster_topics)
+
+    pipeline.timed("write", write_outputs, args.output_dir, texts, lemmas, labels, keywords_dir, general_dir,
+                   cluster_topics_dir)
+    store.print_stats()
+    pipeline.print_report()
+
+
+def write_outputs(output_dir, texts, lemmas, labels, keywords_dir, general_dir, cluster_topics_dir):
+    # The tables the exploration notebooks read, rebuilt from the artifacts
+    keywords_output = os.path.join(output_dir, "keywords")
+    os.makedirs(keywords_output, exist_ok=True)
+    revisions = pd.DataFrame({"source": texts["source"], "lemmatized_text": lemmas,
+                              "original_text": texts["original_text"]})
+
+    clusters = revisions.assign(Cluster=labels)[labels != -1]
+    clusters = clusters.sort_values("Cluster", kind="stable")[["Cluster", "source", "lemmatized_text", "original_text"]]
+    clusters.to_csv(os.path.join(output_dir, "revision_clusters_sorted.csv"), index=False, encoding="utf-8")
+
+    general_topics = np.load(os.path.join(general_dir, "topics.npy"))
+    general = revisions.assign(Topic=general_topics)[general_topics != -1]
+    general = general.sort_values("Topic", kind="stable")[["Topic", "source", "lemmatized_text", "original_text"]]
+    general.to_csv(os.path.join(output_dir, "bertopic_general_corpus_assignments_sorted.csv"), index=False,
+                   encoding="utf-8")
+
+    cluster_topics = np.load(os.path.join(cluster_topics_dir, "topics.npy"))
+    cluster_topics_table = pd.read_csv(os.path.join(cluster_topics_dir, "topics.csv"), encoding="utf-8",
+                                       keep_default_na=False)
+    per_cluster = write_cluster_topics(revisions, labels, cluster_topics, cluster_topics_table, output_dir)
+
+    shutil.copyfile(os.path.join(keywords_dir, "cluster_keywords.csv"),
+                    os.path.join(keywords_output, "cluster_keywords_sorted.csv"))
+    shutil.copyfile(os.path.join(general_dir, "topics.csv"),
+                    os.path.join(keywords_output, "general_corpus_topics_bertopic_sorted.csv"))
+    print(f"[write] {len(clusters)} clustered revisions, {len(general)} general and {per_cluster} "
+          f"per-cluster topic assignments written to {output_dir}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cluster the analyses of the weaponised revisions and extract "
+                                                 "their keywords and topics, reusing unchanged stages.")
+    parser.add_argument("--input-dir", default=input_directory, help="directory with the *_output.csv files")
+    parser.add_argument("--output-dir", default=output_directory)
+    parser.add_argument("--work-dir", default=work_directory, help="stage artifacts")
+    parser.add_argument("--force", nargs="*", default=[], metavar="STAGE", help="rerun these stages anyway")
+    parser.add_argument("--model", default=default_model, help="SentenceTransformer model")
+    parser.add_argument("--spacy-model", default=spacy_model)
+    parser.add_argument("--n-process", type=int, default=n_process, help="spaCy lemmatization processes")
+    parser.add_argument("--n-neighbors", type=int, default=40)
+    parser.add_argument("--n-components", type=int, default=15)
+    parser.add_argument("--metric", default="cosine")
+    parser.add_argument("--random-state", type=int, default=42)
+    parser.add_argument("--min-cluster-size", type=int, default=20)
+    parser.add_argument("--keywords-top-n", type=int, default=10, help="keyphrases per n-gram size")
+    parser.add_argument("--keywords-candidates", type=int, default=30)
+    parser.add_argument("--keywords-diversity", type=float, default=0.0, help="MMR diversity of the keyphrases")
+    parser.add_argument("--keywords-min-df", type=int, default=2, help="smallest document frequency of a keyphrase")
+    parser.add_argument("--topics-top-n", type=int, default=10, help="words per BERTopic topic")
+    parser.add_argument("--min-topic-documents", type=int, default=10,
+                        help="smallest cluster with a topic model of its own")
+    parser.add_argument("--workers", type=int, default=num_workers, help="clusters fitted in parallel")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    # python clustering_pipeline.py --n-neighbors 40 --n-components 15 --keywords-top-n 15
+    run(parse_args())
@@ -0,0 +1,173 @@
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Relative to src/ and notebooks/ alike
+data_directory = "../data"
+dataset_directory = "../data/columnar"
+compression = "zstd"
+
+# table -> (id columns, name column) of the assignment tables
+TABLES = {
+    "clusters": (["cluster"], "Cluster_Name"),
+    "cluster_topics": (["cluster", "topic"], "Cluster_Topic_Name"),
+    "general_topics": (["topic"], "Topic_Name"),
+}
+TECHNIQUE_COLUMNS = ["reduced_weaponization_technique", "weaponization_technique"]
+SCOPES = ["all", "pro-armenian", "anti-armenian"]
+# Stance of the rows of the finegrained scopes
+SCOPE_STANCES = {"pro-armenian": "Pro-Armenian", "anti-armenian": "Anti-Armenian"}
+
+
+# ----------------------------
+# Columnar dataset
+# ----------------------------
+# The CSV tables between the stages repeat original_text (and
+# lemmatized_text) on every row of every table. Here each revision text is
+# stored once, in texts.parquet, under a revision_id; clusters, cluster_topics
+# and general_topics.parquet only hold ids, names and techniques per scope
+# ("all" for the UPDATED_* tables, "pro-armenian" / "anti-armenian" for the
+# finegrained copies, which are clustered separately). The finegrained tables
+# come from a separate run over other analysis texts, with no revision key
+# shared with the UPDATED_* ones, so stance is only known in the finegrained
+# scopes (where it is the scope itself). Repeated strings
+# (source, names, techniques, stance) are pandas categoricals, i.e.
+# dictionary-encoded columns in Parquet.
+
+def source_files(data_dir=data_directory):
+    """
+    Returns: list of (table, scope, path) of the CSV tables the dataset is built from.
+    """
+    files = []
+    for table in TABLES:
+        files.append((table, "all", os.path.join(data_dir, "weaponization_analysis",
+                                                 f"UPDATED_{table}_with_reduced_weaponization_techniques_named.csv")))
+        for scope in SCOPES[1:]:
+            files.append((table, scope, os.path.join(data_dir, "weaponization_analysis", "finegrained",
+                                                     f"{scope}_{table}_with_reduced_weaponization_techniques_named.csv")))
+    return [(table, scope, path) for table, scope, path in files if os.path.exists(path)]
+
+
+class _TextRegistry:
+    # revision_id of every (source, original_text), in order of appearance
+    def __init__(self):
+        self.ids = {}
+        self.lemmas = {}
+
+    def id_column(self, df):
+        ids = np.empty(len(df), dtype=np.int32)
+        for i, key in enumerate(zip(df["source"], df["original_text"])):
+            ids[i] = self.ids.setdefault(key, len(self.ids))
+        return ids
+
+    def add_lemmas(self, df):
+        for key, lemma in zip(zip(df["source"], df["original_text"]), df["lemmatized_text"]):
+            if key in self.ids and isinstance(lemma, str):
+                self.lemmas[self.ids[key]] = lemma
+
+    def table(self):
+        keys = list(self.ids)
+        return pd.DataFrame({
+            "revision_id": np.arange(len(keys), dtype=np.int32),
+            "source": pd.Categorical([source for source, _ in keys]),
+            "original_text": [text for _, text in keys],
+            "lemmatized_text": [self.lemmas.get(i) for i in range(len(keys))],
+        })
+
+
+def _categorical(df, columns):
+    for column in columns:
+        df[column] = df[column].astype("category")
+    return df
+
+
+def build_dataset(data_dir=data_directory, directory=dataset_directory):
+    """
+    Converts the CSV tables of data_dir into the Parquet tables of directory.
+    """
+    start = time.time()
+    registry = _TextRegistry()
+    csv_bytes = 0
+    tables = {table: [] for table in TABLES}
+    for table, scope, path in source_files(data_dir):
+        csv_bytes += os.path.getsize(path)
+        df = pd.read_csv(path, encoding="utf-8")
+        id_columns, name_column = TABLES[table]
+        narrow = pd.DataFrame({"revision_id": registry.id_column(df), "scope": scope})
+        for column in id_columns:
+            narrow[column] = df[column].astype(np.int16)
+        for column in [name_column] + TECHNIQUE_COLUMNS:
+            narrow[column] = df[column]
+        tables[table].append(narrow)
+
+    # lemmas come from the clustering outputs (same revisions as the "all" tables)
+    for name in ["revision_clusters_sorted.csv", "bertopic_general_corpus_assignments_sorted.csv",
+                 "bertopic_per_cluster_topic_assignments_sorted.csv"]:
+        path = os.path.join(data_dir, name)
+        if os.path.exists(path):
+            csv_bytes += os.path.getsize(path)
+            registry.add_lemmas(pd.read_csv(path, encoding="utf-8"))
+
+    os.makedirs(directory, exist_ok=True)
+    outputs = {"texts": _categorical(registry.table(), ["source"])}
+    for table, parts in tables.items():
+        if parts:
+            _, name_column = TABLES[table]
+            outputs[table] = _categorical(pd.concat(parts, ignore_index=True),
+                                          ["scope", name_column] + TECHNIQUE_COLUMNS)
+    parquet_bytes = 0
+    for name, df in outputs.items():
+        path = os.path.join(directory, f"{name}.parquet")
+        df.to_parquet(path, index=False, compression=compression)
+        parquet_bytes += os.path.getsize(path)
+        print(f"[columnar] {name}: {len(df)} rows")
+    print(f"[columnar] {csv_bytes / 1024 ** 2:.1f} MB of CSV -> {parquet_bytes / 1024 ** 2:.1f} MB of Parquet in "
+          f"{directory} ({time.time() - start:.1f}s)")
+
+
+# ----------------------------
+# Loader
+# ----------------------------
+
+def load_texts(columns=None, directory=dataset_directory):
+    return pd.read_parquet(os.path.join(directory, "texts.parquet"), columns=columns)
+
+
+def load(table, scope="all", text_columns=("original_text", "source"), stance=False, directory=dataset_directory):
+    """
+    table: "clusters", "cluster_topics" or "general_topics"
+    scope: "all", "pro-armenian" or "anti-armenian" (None: every scope, with a scope column)
+    text_columns: texts.parquet columns joined in (e.g. also "lemmatized_text")
+    stance: also add the stance of the finegrained tables (ValueError for
+    scope "all"; missing on the "all" rows when scope is None)
+
+    Returns: DataFrame with the columns of the matching CSV table (ids, name,
+    techniques, original_text, source), plus revision_id.
+    """
+    if stance and scope == "all":
+        raise ValueError('Stance is only known for the finegrained scopes ("pro-armenian", "anti-armenian")')
+    filters = [("scope", "==", scope)] if scope is not None else None
+    df = pd.read_parquet(os.path.join(directory, f"{table}.parquet"), filters=filters)
+    if stance:
+        # every row of a finegrained table was judged with the table's stance
+        scopes = df["scope"].astype(object) if scope is None else pd.Series(scope, index=df.index)
+        df["stance"] = pd.Categorical(scopes.map(SCOPE_STANCES), categories=list(SCOPE_STANCES.values()))
+    if scope is not None:
+        df = df.drop(columns="scope")
+    df = df.reset_index(drop=True)
+    if text_columns:
+        texts = load_texts(["revision_id"] + list(text_columns), directory)
+        df = df.merge(texts, on="revision_id", how="left", sort=False)
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the cluster / topic / technique CSV tables into the "
+                                                 "columnar (Parquet) dataset.")
+    parser.add_argument("--data-dir", default=data_directory)
+    parser.add_argument("--output-dir", default=dataset_directory)
+    args = parser.parse_args()
+    build_dataset(args.data_dir, args.output_dir)
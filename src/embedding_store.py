@@ -0,0 +1,172 @@
+import os
+import json
+import hashlib
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no file locking, only one process may write a store at a time
+    fcntl = None
+
+# Relative to src/ and notebooks/ alike, like the LLM cache
+store_directory = "../embeddings"
+default_model = "Alibaba-NLP/gte-multilingual-base"
+encode_batch_size = 64
+
+
+# ----------------------------
+# On-disk embedding store
+# ----------------------------
+# One directory per model holding the vectors of every text encoded so far:
+# vectors.f16 (float16 rows, memory-mapped on read, appended on write),
+# keys.txt (the text hash of each row, in row order) and meta.json (model and
+# dimension). A text is only ever encoded once per model, whichever notebook
+# cell or script asks for it first. Appends (and the repair of a run that died
+# mid-append) hold an exclusive lock on the store's "lock" file, so notebooks
+# and scripts can share a store; rows appended by another process are picked
+# up from keys.txt before appending.
+
+def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, model_name=default_model, directory=store_directory, model=None):
+        """
+        model: an already loaded SentenceTransformer for model_name (loaded on
+        first use otherwise)
+        """
+        self.model_name = model_name
+        self.path = os.path.join(directory, model_name.replace("/", "__"))
+        self._model = model
+        self._vectors = None
+        self.hits = 0
+        self.encoded = 0
+        os.makedirs(self.path, exist_ok=True)
+        self._vectors_path = os.path.join(self.path, "vectors.f16")
+        self._keys_path = os.path.join(self.path, "keys.txt")
+        self._meta_path = os.path.join(self.path, "meta.json")
+        self._lock_path = os.path.join(self.path, "lock")
+
+        self.dim = None
+        self._rows = {}
+        self._count = 0  # rows of keys.txt read so far
+        self._keys_bytes = 0  # bytes of keys.txt read so far
+        with self._locked():
+            self._read_new_keys()
+            self._repair()
+
+    @contextmanager
+    def _locked(self):
+        with open(self._lock_path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _read_new_keys(self):
+        # meta and the complete keys.txt lines appended since the last read,
+        # by this process or another one
+        if self.dim is None and os.path.exists(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        if not os.path.exists(self._keys_path):
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._keys_bytes)
+            data = f.read()
+        data = data[:data.rfind(b"\n") + 1]
+        for key in data.decode("utf-8").splitlines():
+            self._rows.setdefault(key, self._count)
+            self._count += 1
+        if data:
+            self._keys_bytes += len(data)
+            self._vectors = None
+
+    def _repair(self):
+        # Under the lock nobody is appending, so a partial last line of keys or
+        # vectors without keys are left by a run that died while appending
+        if os.path.exists(self._keys_path) and os.path.getsize(self._keys_path) > self._keys_bytes:
+            os.truncate(self._keys_path, self._keys_bytes)
+        if self.dim is not None and os.path.exists(self._vectors_path):
+            size = self._count * self.dim * 2
+            if os.path.getsize(self._vectors_path) > size:
+                os.truncate(self._vectors_path, size)
+
+    @property
+    def model(self):
+        # loaded on the first text not stored yet, and only once (also
+        # exposed to notebooks that need the SentenceTransformer itself)
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name, trust_remote_code=True)
+        return self._model
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, text):
+        return text_key(text) in self._rows
+
+    def vectors(self):
+        """
+        Returns: read-only float16 memmap of every stored row.
+        """
+        if self._vectors is None and self._rows:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float16, mode="r",
+                                      shape=(self._count, self.dim))
+        return self._vectors
+
+    def _append(self, keys, vectors):
+        with self._locked():
+            self._read_new_keys()
+            self._repair()
+            # another process may have stored some of these texts meanwhile
+            new = [i for i, key in enumerate(keys) if key not in self._rows]
+            if not new:
+                return
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_name, "dim": self.dim, "dtype": "float16"}, f)
+            # vectors first: keys without vectors would point past the end
+            with open(self._vectors_path, "ab") as f:
+                vectors[new].astype(np.float16).tofile(f)
+            with open(self._keys_path, "a", encoding="utf-8") as f:
+                f.writelines(keys[i] + "\n" for i in new)
+            self._read_new_keys()
+
+    def rows(self, texts):
+        """
+        Returns: the store row of every text, encoding (and storing) the texts
+        not stored yet.
+        """
+        keys = [text_key(text) for text in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self._rows and key not in missing:
+                missing[key] = text
+        self.hits += len(keys) - len(missing)
+        if missing:
+            vectors = self.model.encode(list(missing.values()), batch_size=encode_batch_size,
+                                        show_progress_bar=len(missing) > encode_batch_size)
+            self._append(list(missing), np.asarray(vectors))
+            self.encoded += len(missing)
+        return np.fromiter((self._rows[key] for key in keys), dtype=np.int64, count=len(keys))
+
+    def encode(self, texts):
+        """
+        Drop-in for SentenceTransformer.encode(texts).
+
+        Returns: float32 array (len(texts), dim) in the order of texts.
+        """
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        rows = self.rows(texts)
+        return np.asarray(self.vectors()[rows], dtype=np.float32)
+
+    def print_stats(self):
+        print(f"[embeddings] {self.model_name}: {len(self)} stored, {self.hits} texts served from the "
+              f"store, {self.encoded} encoded")
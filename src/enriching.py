@@ -1,24 +1,31 @@
 import os
 import json
-import difflib
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+import shutil
+import hashlib
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from record_stream import iter_jsonl_range, split_jsonl, save_jsonl, last_record_end, last_record
+from word_diff import diff_words
 
 input_directory = "revisions_new"
 output_directory = "csv_results"
 os.makedirs(output_directory, exist_ok=True)
 
-def load_jsonl(filepath):
-    records = []
-    with open(filepath, "r", encoding="utf-8") as f:
-        for line in f:
-            if line.strip():
-                records.append(json.loads(line))
-    return records
-
-def save_jsonl(filepath, records):
-    with open(filepath, "w", encoding="utf-8") as f:
-        for record in records:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+# "process": CPU-bound enrichment on a process pool, large files sharded by record range
+# "thread": same shards on a thread pool (effectively one core under the GIL)
+execution_mode = "process"
+num_workers = os.cpu_count() or 4
+# Files larger than this are split into shards of about this size
+shard_bytes = 32 * 1024 * 1024
+# Only enrich revisions appended since the last run (tracked in the manifest)
+incremental = True
+manifest_path = os.path.join(output_directory, "enrichment_manifest.json")
+# Size of the input window hashed just before the recorded offset, used to
+# detect inputs that were rewritten rather than appended to
+tail_hash_bytes = 4096
 
 def parse_unidiff(diff_text):
     added_lines = []
@@ -40,12 +47,9 @@ def parse_unidiff(diff_text):
 
             if i + 1 < len(lines) and lines[i + 1].startswith('+'):
                 added_line = lines[i + 1][1:].strip()
-                diff = difflib.ndiff(removed_line.split(), added_line.split())
-                for word in diff:
-                    if word.startswith('+ '):
-                        word_added.append(word[2:])
-                    elif word.startswith('- '):
-                        word_removed.append(word[2:])
+                added, removed = diff_words(removed_line.split(), added_line.split())
+                word_added.extend(added)
+                word_removed.extend(removed)
                 i += 2
             else:
                 removed_lines.append(removed_line)
@@ -69,28 +73,178 @@ def process_record(record):
         record["Removed_Words"] = word_removed
     return record
 
-def process_file(file_path):
-    try:
-        records = load_jsonl(file_path)
-        updated_records = [process_record(record) for record in records]
+def enriched_output_path(file_path):
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(output_directory, f"{base_name}_enriched.jsonl")
+
+# ---------------------------
+# Incremental Manifest
+# ---------------------------
+# One entry per input file:
+#   offset         bytes of input already enriched
+#   records        number of records enriched so far
+#   last_timestamp Timestamp of the last enriched revision
+#   tail_hash      sha256 of the tail_hash_bytes of input before offset
+#   output_bytes   size of the *_enriched.jsonl output after the last run
+
+def load_manifest():
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def tail_hash(file_path, offset):
+    start = max(0, offset - tail_hash_bytes)
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+def plan_file(file_path, manifest):
+    """
+    Returns: (file_path, start, end, append) -- the byte range of the input that
+    still needs enriching, and whether its output is appended to the existing
+    *_enriched.jsonl or replaces it.
+    """
+    end = last_record_end(file_path)
+    output_file = enriched_output_path(file_path)
+    entry = manifest.get(os.path.basename(file_path))
+    if not incremental or entry is None or not os.path.exists(output_file):
+        return (file_path, 0, end, False)
+
+    output_bytes = os.path.getsize(output_file)
+    if entry["offset"] > end or output_bytes < entry["output_bytes"] \
+            or tail_hash(file_path, entry["offset"]) != entry["tail_hash"]:
+        # the input was rewritten (or the output tampered with): start over
+        print(f"[!] {os.path.basename(file_path)} changed since the last run, re-enriching from scratch")
+        return (file_path, 0, end, False)
+    if output_bytes > entry["output_bytes"]:
+        # drop a tail left behind by an interrupted append
+        os.truncate(output_file, entry["output_bytes"])
+    return (file_path, entry["offset"], end, True)
+
+def update_manifest_entry(manifest, file_path, end, count, append):
+    name = os.path.basename(file_path)
+    previous = manifest.get(name, {}) if append else {}
+    record = last_record(file_path, end)
+    manifest[name] = {
+        "offset": end,
+        "records": previous.get("records", 0) + count,
+        "last_timestamp": (record or {}).get("Timestamp", previous.get("last_timestamp")),
+        "tail_hash": tail_hash(file_path, end),
+        "output_bytes": os.path.getsize(enriched_output_path(file_path)),
+    }
+
+# ---------------------------
+# Pool Execution
+# ---------------------------
+
+def process_shard(file_path, start, end, part_path):
+    # Runs in a worker: enriches the records of one byte range
+    started = time.perf_counter()
+    updated_records = (process_record(record) for record in iter_jsonl_range(file_path, start, end))
+    count = save_jsonl(part_path, updated_records)
+    return (os.getpid(), threading.get_ident()), count, time.perf_counter() - started
+
+def merge_shards(part_paths, output_file, append=False):
+    # Concatenate the shard outputs in record order, after the existing output
+    # when appending
+    if append:
+        with open(output_file, "ab") as out:
+            for part_path in part_paths:
+                with open(part_path, "rb") as part:
+                    shutil.copyfileobj(part, out)
+    else:
+        tmp_path = output_file + ".tmp"
+        with open(tmp_path, "wb") as out:
+            for part_path in part_paths:
+                with open(part_path, "rb") as part:
+                    shutil.copyfileobj(part, out)
+        os.replace(tmp_path, output_file)
+    for part_path in part_paths:
+        os.remove(part_path)
+
+def run_pool(tasks, manifest, executor_class=ProcessPoolExecutor, workers=num_workers):
+    """
+    tasks: list of (file_path, start, end, append) as returned by plan_file
+    """
+    shards = []
+    parts_per_file = {}
+    task_per_file = {}
+    for file_path, start, end, append in tasks:
+        if append and start >= end:
+            print(f"[✓] Up to date: {os.path.splitext(os.path.basename(file_path))[0]}")
+            continue
+        output_file = enriched_output_path(file_path)
+        ranges = split_jsonl(file_path, shard_bytes, start, end) if end > start else [(start, end)]
+        parts_per_file[file_path] = [f"{output_file}.part{k:05d}" for k in range(len(ranges))]
+        task_per_file[file_path] = (start, end, append)
+        for (shard_start, shard_end), part_path in zip(ranges, parts_per_file[file_path]):
+            shards.append((shard_end - shard_start, file_path, shard_start, shard_end, part_path))
 
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        output_file = os.path.join(output_directory, f"{base_name}_enriched.jsonl")
-        save_jsonl(output_file, updated_records)
-        print(f"[✓] Processed: {base_name}")
-    except Exception as e:
-        print(f"[!] Failed on {file_path}: {e}")
+    # Largest shards first, so no big shard is left alone at the end of the run
+    shards.sort(key=lambda shard: shard[0], reverse=True)
+
+    remaining = {file_path: len(parts) for file_path, parts in parts_per_file.items()}
+    counts = defaultdict(int)
+    failed = set()
+    worker_stats = defaultdict(lambda: [0, 0.0])  # (pid, thread id) -> [records, busy seconds]
+    started = time.perf_counter()
+
+    with executor_class(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process_shard, file_path, start, end, part_path): file_path
+            for _, file_path, start, end, part_path in shards
+        }
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                worker, count, elapsed = future.result()
+                worker_stats[worker][0] += count
+                worker_stats[worker][1] += elapsed
+                counts[file_path] += count
+            except Exception as e:
+                print(f"[!] Failed on {file_path}: {e}")
+                failed.add(file_path)
+
+            remaining[file_path] -= 1
+            if remaining[file_path] == 0:
+                parts = parts_per_file[file_path]
+                if file_path in failed:
+                    for part_path in parts:
+                        if os.path.exists(part_path):
+                            os.remove(part_path)
+                    continue
+                start, end, append = task_per_file[file_path]
+                merge_shards(parts, enriched_output_path(file_path), append)
+                update_manifest_entry(manifest, file_path, end, counts[file_path], append)
+                save_manifest(manifest)
+                base_name = os.path.splitext(os.path.basename(file_path))[0]
+                print(f"[✓] Processed: {base_name} ({counts[file_path]} {'new ' if append else ''}records, {len(parts)} shards)")
+
+    total_records = sum(records for records, _ in worker_stats.values())
+    wall = time.perf_counter() - started
+    print(f"[✓] {total_records} records in {wall:.1f}s ({total_records / max(wall, 1e-9):.0f} records/sec overall)")
+    for (pid, thread), (records, busy) in sorted(worker_stats.items()):
+        print(f"    worker {pid}/{thread}: {records} records, {records / max(busy, 1e-9):.0f} records/sec")
 
 # ---------------------------
-# Thread Pool Executor
+# Execution Section
 # ---------------------------
-jsonl_files = [
-    os.path.join(input_directory, f)
-    for f in os.listdir(input_directory)
-    if f.endswith(".jsonl")
-]
-
-with ThreadPoolExecutor(max_workers=12) as executor:
-    futures = [executor.submit(process_file, file_path) for file_path in jsonl_files]
-    for _ in as_completed(futures):
-        pass  # progress is printed in process_file
+
+if __name__ == "__main__":
+    jsonl_files = [
+        os.path.join(input_directory, f)
+        for f in os.listdir(input_directory)
+        if f.endswith(".jsonl")
+    ]
+
+    manifest = load_manifest()
+    tasks = [plan_file(file_path, manifest) for file_path in jsonl_files]
+    executor_class = ProcessPoolExecutor if execution_mode == "process" else ThreadPoolExecutor
+    run_pool(tasks, manifest, executor_class)
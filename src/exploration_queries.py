@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from columnar_store import TABLES, dataset_directory
+
+# Relative to src/ and notebooks/ alike
+database_path = "../data/exploration.sqlite"
+
+# Columns counts() can group and filter by (stance only in the finegrained scopes)
+DIMENSIONS = ["scope", "cluster", "topic", "name", "technique", "reduced_technique", "stance", "source"]
+
+
+# ----------------------------
+# Exploration query layer
+# ----------------------------
+# A SQLite database built from the columnar dataset (columnar_store.py):
+# "facts" has one row per revision and grouping ("clusters", "cluster_topics",
+# "general_topics") and scope, with its cluster / topic / name / technique /
+# stance / source, and "cube" its counts grouped by all of them. Every count
+# the exploration notebooks print (techniques per cluster, per topic within a
+# cluster, per stance, per source, ...) is a GROUP BY over the cube, which has
+# a row per distinct combination rather than per revision. Stance is only
+# known in the finegrained scopes (see columnar_store.py), so stance queries
+# in scope "all" raise ValueError instead of counting NULLs.
+
+def _facts(dataset_dir):
+    from columnar_store import load
+
+    parts = []
+    for grouping, (id_columns, name_column) in TABLES.items():
+        df = load(grouping, scope=None, text_columns=["source"], stance=True, directory=dataset_dir)
+        parts.append(pd.DataFrame({
+            "grouping": grouping,
+            "revision_id": df["revision_id"],
+            "scope": df["scope"].astype(object),
+            "cluster": df["cluster"] if "cluster" in id_columns else None,
+            "topic": df["topic"] if "topic" in id_columns else None,
+            "name": df[name_column].astype(object),
+            "technique": df["weaponization_technique"].astype(object),
+            "reduced_technique": df["reduced_weaponization_technique"].astype(object),
+            "stance": df["stance"].astype(object),
+            "source": df["source"].astype(object),
+        }))
+    return pd.concat(parts, ignore_index=True)
+
+
+def build_database(dataset_dir=dataset_directory, path=database_path):
+    from columnar_store import load_texts
+
+    start = time.time()
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    facts = _facts(dataset_dir)
+    facts.to_sql("facts", conn, index=False)
+    texts = load_texts(directory=dataset_dir)
+    texts.assign(source=texts["source"].astype(object)).to_sql("texts", conn, index=False)
+    dimensions = ", ".join(["grouping"] + DIMENSIONS)
+    conn.executescript(f"""
+        CREATE INDEX facts_lookup ON facts (grouping, scope, cluster, topic);
+        CREATE UNIQUE INDEX texts_id ON texts (revision_id);
+        CREATE TABLE cube AS SELECT {dimensions}, COUNT(*) AS n FROM facts GROUP BY {dimensions};
+        CREATE INDEX cube_lookup ON cube (grouping, scope);
+    """)
+    cube_rows = conn.execute("SELECT COUNT(*) FROM cube").fetchone()[0]
+    conn.commit()
+    conn.close()
+    os.replace(tmp_path, path)
+    print(f"[queries] {len(facts)} facts, {cube_rows} cube rows in {path} ({time.time() - start:.1f}s)")
+
+
+class ExplorationDB:
+    def __init__(self, path=database_path, dataset_dir=dataset_directory, rebuild=False):
+        """
+        The database is (re)built when missing, when the dataset is newer, or
+        when rebuild is set.
+        """
+        parquet_files = [os.path.join(dataset_dir, f"{name}.parquet") for name in list(TABLES) + ["texts"]]
+        dataset_time = max(os.path.getmtime(p) for p in parquet_files if os.path.exists(p))
+        if rebuild or not os.path.exists(path) or os.path.getmtime(path) < dataset_time:
+            build_database(dataset_dir, path)
+        self.conn = sqlite3.connect(path)
+
+    def sql(self, query, params=()):
+        # any query over facts / texts / cube, as a DataFrame
+        return pd.read_sql_query(query, self.conn, params=params)
+
+    @staticmethod
+    def _where(grouping, scope, filters, by=()):
+        if scope == "all" and ("stance" in by or filters.get("stance") is not None):
+            raise ValueError('Stance is only known for the finegrained scopes ("pro-armenian", "anti-armenian")')
+        clauses, params = ["grouping = ?"], [grouping]
+        if scope is not None:
+            clauses.append("scope = ?")
+            params.append(scope)
+        for column, value in filters.items():
+            if column not in DIMENSIONS:
+                raise ValueError(f"Unknown column {column!r}, expected one of {DIMENSIONS}")
+            if value is None:
+                continue
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        return " AND ".join(clauses), params
+
+    def counts(self, by, grouping="clusters", scope="all", **filters):
+        """
+        by: columns to group by (see DIMENSIONS), e.g. ["cluster", "technique"]
+        grouping: "clusters", "cluster_topics" or "general_topics"
+        scope: "all", "pro-armenian", "anti-armenian" (None: every scope, the
+        "all" rows without a stance)
+        filters: column=value or column=[values], e.g. stance="Pro-Armenian"
+
+        Returns: DataFrame of by + "count", ordered by the by columns.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        unknown = [column for column in by if column not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown columns {unknown}, expected some of {DIMENSIONS}")
+        where, params = self._where(grouping, scope, filters, by)
+        columns = ", ".join(by)
+        if not by:
+            return self.sql(f"SELECT SUM(n) AS count FROM cube WHERE {where}", params)
+        return self.sql(f"SELECT {columns}, SUM(n) AS count FROM cube WHERE {where} "
+                        f"GROUP BY {columns} ORDER BY {columns}", params)
+
+    def technique_counts(self, grouping="clusters", scope="all", by=("cluster",), reduced=False, **filters):
+        """
+        Returns: DataFrame of by + technique + count (most frequent technique
+        first within each group) + entries (size of the group).
+        """
+        technique = "reduced_technique" if reduced else "technique"
+        by = list(by)
+        df = self.counts(by + [technique], grouping, scope, **filters)
+        if not by:
+            return df.sort_values("count", ascending=False, kind="stable").reset_index(drop=True)
+        df["entries"] = df.groupby(by)["count"].transform("sum")
+        return df.sort_values(by + ["count"], ascending=[True] * len(by) + [False], kind="stable").reset_index(drop=True)
+
+    def entries(self, grouping="clusters", scope="all", limit=None, **filters):
+        """
+        Returns: DataFrame of the matching revisions, with original_text.
+        """
+        where, params = self._where(grouping, scope, filters)
+        where = " AND ".join(f"f.{clause}" for clause in where.split(" AND "))
+        query = (f"SELECT f.revision_id, f.scope, f.cluster, f.topic, f.name, f.technique, f.reduced_technique, "
+                 f"f.stance, f.source, t.original_text FROM facts f JOIN texts t USING (revision_id) WHERE {where} "
+                 f"ORDER BY f.cluster, f.topic, f.revision_id")
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        return self.sql(query, params)
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    build_database()
@@ -0,0 +1,186 @@
+import json
+
+import pandas as pd
+
+from record_stream import iter_jsonl
+
+
+# ----------------------------
+# Structured weaponisation judgments
+# ----------------------------
+# Instead of free text ("**Judgment: Not Weaponised**" ...) that combine_csv has
+# to recover with regexes, the model is constrained by a JSON schema and each
+# judgment is written as one row keyed by source and record index.
+
+STANCES = ["Pro-Armenian", "Anti-Armenian", "None"]
+
+
+def judgment_format(stance=False, packed=False):
+    """
+    stance: also ask for the Pro-/Anti-Armenian stance of the change
+    packed: several records per request (record_packing.py), one judgment per record id
+
+    Returns: the JSON-schema response_format of the answer.
+    """
+    properties = {"judgment": {"type": "string", "enum": ["Weaponised", "Not Weaponised"]}}
+    if stance:
+        properties["stance"] = {"type": "string", "enum": STANCES}
+    properties["explanation"] = {"type": "string"}
+    properties["indicators"] = {"type": "array", "items": {"type": "string"}}
+    item = {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+    name = "weaponisation_judgment"
+    if packed:
+        item["properties"] = {"id": {"type": "integer"}, **properties}
+        item["required"] = ["id"] + list(properties)
+        item = {
+            "type": "object",
+            "properties": {"judgments": {"type": "array", "items": item}},
+            "required": ["judgments"],
+            "additionalProperties": False,
+        }
+        name = "weaponisation_judgments"
+    if stance:
+        name += "_stance"
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": item}}
+
+
+JUDGMENT_LINE = '- "judgment": "Weaponised" or "Not Weaponised"'
+STANCE_LINE = ('- "stance": for a weaponised change "Pro-Armenian" or "Anti-Armenian", otherwise "None". '
+               '"Pro-Armenian" also encompasses anti-Turkish, anti-Azerbaijani or anti-any-other-Armenian-historical-rival '
+               'stances, "Anti-Armenian" also encompasses pro-Turkish, pro-Azerbaijani or '
+               'pro-any-other-Armenian-historical-rival stances')
+OTHER_LINES = """- "explanation": the brief Explanation
+- "indicators": the specific words or phrases from the "+" or "-" lines the judgment relies on (empty list if none)"""
+
+
+def answer_instruction(stance=False, packed=False):
+    # Replaces the trailing "Your analysis:" of the free-text prompt
+    fields = JUDGMENT_LINE + ("\n" + STANCE_LINE if stance else "") + "\n" + OTHER_LINES
+    if packed:
+        return ('Judge every record on its own. Answer with a JSON object {"judgments": [...]} holding one entry '
+                'per record, with the fields:\n- "id": the "id" of the record\n' + fields)
+    return "Answer with a JSON object with the fields:\n" + fields
+
+
+def parse_judgment(content):
+    """
+    Returns: dict with judgment / stance / explanation / indicators (stance ""
+    when it was not asked for). Content that is not valid JSON (e.g. an API
+    error message) is kept as the explanation with judgment "Not Found", so the
+    record is still written.
+    """
+    try:
+        judgment = json.loads(content)
+        return {
+            "judgment": judgment["judgment"],
+            "stance": judgment.get("stance", ""),
+            "explanation": judgment.get("explanation", ""),
+            "indicators": judgment.get("indicators", []),
+        }
+    except (ValueError, TypeError, KeyError):
+        return {"judgment": "Not Found", "stance": "", "explanation": content, "indicators": []}
+
+
+def split_packed_judgments(content):
+    """
+    Returns: dict record id -> single-record JSON answer for every record the
+    packed answer covers (empty if the answer is not valid JSON).
+    """
+    try:
+        entries = json.loads(content)["judgments"]
+    except (ValueError, TypeError, KeyError):
+        return {}
+    answers = {}
+    for entry in entries:
+        if isinstance(entry, dict) and "id" in entry and "judgment" in entry:
+            answers[entry["id"]] = json.dumps({k: v for k, v in entry.items() if k != "id"}, ensure_ascii=False)
+    return answers
+
+
+def merge_judgments(contents):
+    """
+    contents: JSON answers for the parts of one record (e.g. a long
+    first_version split into parts)
+
+    Returns: one JSON answer, "Weaponised" if any part is (with the stance of
+    the first weaponised part).
+    """
+    judgments = [parse_judgment(content) for content in contents]
+    verdicts = {j["judgment"] for j in judgments}
+    if "Weaponised" in verdicts:
+        verdict = "Weaponised"
+    elif verdicts == {"Not Weaponised"}:
+        verdict = "Not Weaponised"
+    else:
+        verdict = "Not Found"
+    indicators = []
+    for j in judgments:
+        indicators.extend(i for i in j["indicators"] if i not in indicators)
+    merged = {"judgment": verdict}
+    if any(j["stance"] for j in judgments):
+        stances = [j["stance"] for j in judgments if j["judgment"] == verdict and j["stance"]]
+        merged["stance"] = stances[0] if stances else "None"
+    merged["explanation"] = " ".join(j["explanation"] for j in judgments)
+    merged["indicators"] = indicators
+    return json.dumps(merged, ensure_ascii=False)
+
+
+def judgment_row(source, idx, record, judgment):
+    # Same columns as the *_output.csv files built by combine_csv.ipynb, plus the
+    # record index, the stance (empty unless asked for) and the indicators
+    comment = record.get("Comment", "")
+    analysis = judgment["explanation"]
+    if comment:
+        final_text = f"Analysis of the edit: {analysis} Comment by its editor: '{comment}'"
+    else:
+        final_text = f"Analysis of the edit: {analysis}"
+    return {
+        "Source": source,
+        "Record": idx,
+        "version": record.get("version", ""),
+        "Timestamp": record.get("Timestamp", ""),
+        "User": record.get("User", ""),
+        "Comment": comment,
+        "Diff": record.get("Diff", ""),
+        "Added_Lines": " | ".join(record.get("Added_Lines", [])),
+        "Removed_Lines": " | ".join(record.get("Removed_Lines", [])),
+        "Added_Words": " | ".join(record.get("Added_Words", [])),
+        "Removed_Words": " | ".join(record.get("Removed_Words", [])),
+        "Judgment": judgment["judgment"],
+        "Stance": judgment.get("stance", ""),
+        "Analysis": analysis,
+        "Indicators": " | ".join(judgment["indicators"]),
+        "final_text": final_text,
+    }
+
+
+def export_results(jsonl_path, output_path, chunksize=10000):
+    """
+    Converts a *_judgments.jsonl file to Parquet (.parquet, needs pyarrow) or to
+    a CSV compatible with the *_output.csv consumers (.csv), chunk by chunk.
+    """
+    def chunks():
+        rows = []
+        for row in iter_jsonl(jsonl_path):
+            rows.append(row)
+            if len(rows) >= chunksize:
+                yield pd.DataFrame(rows)
+                rows = []
+        if rows:
+            yield pd.DataFrame(rows)
+
+    if output_path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        for df in chunks():
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+        if writer is not None:
+            writer.close()
+    else:
+        for k, df in enumerate(chunks()):
+            df.to_csv(output_path, mode="w" if k == 0 else "a", header=(k == 0), index=False, encoding="utf-8")
@@ -0,0 +1,128 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from embedding_store import encode_batch_size
+from lemmatization import custom_stopwords
+
+ngram_sizes = (1, 2, 3)
+top_n = 10
+# Candidates per cluster and n-gram size that diversity re-ranks
+candidates = 30
+# 0: plain similarity ranking; towards 1: MMR favours keyphrases unlike the ones already picked
+diversity = 0.0
+# Terms in fewer lemmatized texts are not candidates (bounds the vocabulary to encode)
+min_df = 2
+min_comments = 3
+# Clusters scored per matrix product (bounds the clusters x vocabulary score block)
+cluster_chunk = 64
+
+
+# ----------------------------
+# Cluster keyphrases from cached embeddings
+# ----------------------------
+# KeyBERT-style: the keyphrases of a cluster are its n-grams closest to the
+# cluster in embedding space. Instead of re-embedding one concatenated string
+# per cluster, a cluster is the mean of its texts' (already stored) embeddings,
+# and every candidate n-gram of the corpus is embedded once, in memory with the
+# store's model: the n-grams are not analysis texts, so they stay out of the
+# shared EmbeddingStore. Banned terms are dropped from the vocabulary before
+# scoring, and all clusters are scored against it with matrix products.
+
+def ngram_columns(phrases, sizes=ngram_sizes):
+    # "1-grams" / "2-grams" / "3-grams" columns of the keyword tables
+    return {f"{n}-grams": ", ".join(p for p in phrases if len(p.split()) == n) for n in sizes}
+
+
+def _normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def candidate_vocabulary(lemmas, sizes=ngram_sizes, banned=custom_stopwords, min_df=min_df):
+    """
+    Returns: (sparse texts x terms counts, array of terms), without English
+    stop words and terms containing a banned word.
+    """
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    vectorizer = CountVectorizer(ngram_range=(min(sizes), max(sizes)), stop_words="english", min_df=min_df)
+    counts = vectorizer.fit_transform(lemmas)
+    terms = vectorizer.get_feature_names_out()
+    keep = np.array([i for i, term in enumerate(terms)
+                     if len(term.split()) in sizes and not any(ban in term for ban in banned)], dtype=np.int64)
+    return counts[:, keep].tocsr(), terms[keep]
+
+
+def _mmr(scores, vectors, count, diversity):
+    # maximal marginal relevance over one cluster's candidates (sorted by score)
+    picked = [0]
+    similarity = vectors @ vectors.T
+    while len(picked) < min(count, len(scores)):
+        redundancy = similarity[:, picked].max(axis=1)
+        mmr = (1 - diversity) * scores - diversity * redundancy
+        mmr[picked] = -np.inf
+        picked.append(int(np.argmax(mmr)))
+    return picked
+
+
+def cluster_keywords(labels, lemmas, embeddings, store, sizes=ngram_sizes, top_n=top_n, candidates=candidates,
+                     diversity=diversity, banned=custom_stopwords, min_df=min_df, min_comments=min_comments):
+    """
+    labels: cluster label of every text (-1 = noise)
+    lemmas: lemmatized text of every text (lemmatization.lemmatize_texts)
+    embeddings: embedding of every text (EmbeddingStore.encode)
+    store: EmbeddingStore whose model encodes the candidate n-grams (they are
+    not added to it)
+
+    Returns: DataFrame (Cluster, Num_Comments, 1-grams, 2-grams, 3-grams), the
+    top_n keyphrases of each n-gram size per cluster, most similar first.
+    """
+    from scipy import sparse
+
+    start = time.time()
+    labels = np.asarray(labels)
+    columns = ["Cluster", "Num_Comments"] + [f"{n}-grams" for n in sizes]
+    clusters, sizes_per_cluster = np.unique(labels[labels != -1], return_counts=True)
+    clusters = clusters[sizes_per_cluster >= min_comments]
+    sizes_per_cluster = sizes_per_cluster[sizes_per_cluster >= min_comments]
+    if len(clusters) == 0:
+        return pd.DataFrame(columns=columns)
+
+    counts, terms = candidate_vocabulary(lemmas, sizes, banned, min_df)
+    term_vectors = _normalize(np.asarray(store.model.encode(list(terms), batch_size=encode_batch_size,
+                                                            show_progress_bar=len(terms) > encode_batch_size),
+                                         dtype=np.float32))
+    term_sizes = np.array([len(term.split()) for term in terms])
+
+    # clusters x texts membership: which terms occur in a cluster, and its centroid
+    positions = {label: k for k, label in enumerate(clusters)}
+    members = np.flatnonzero(np.isin(labels, clusters))
+    membership = sparse.csr_matrix((np.ones(len(members)), ([positions[l] for l in labels[members]], members)),
+                                   shape=(len(clusters), len(labels)))
+    present = (membership @ counts).tocsr()
+    centroids = _normalize(membership @ _normalize(np.asarray(embeddings, dtype=np.float32)))
+
+    rows = []
+    for chunk_start in range(0, len(clusters), cluster_chunk):
+        chunk = slice(chunk_start, chunk_start + cluster_chunk)
+        scores = centroids[chunk] @ term_vectors.T
+        scores[present[chunk].toarray() == 0] = -np.inf
+        for k, label in enumerate(clusters[chunk]):
+            phrases = []
+            for n in sizes:
+                cols = np.flatnonzero((term_sizes == n) & np.isfinite(scores[k]))
+                if len(cols) == 0:
+                    continue
+                cluster_scores = scores[k, cols]
+                best = np.argsort(-cluster_scores)[:max(candidates, top_n)]
+                cols, cluster_scores = cols[best], cluster_scores[best]
+                if diversity > 0:
+                    order = _mmr(cluster_scores, term_vectors[cols], top_n, diversity)
+                else:
+                    order = range(min(top_n, len(cols)))
+                phrases.extend(terms[cols[i]] for i in order)
+            rows.append({"Cluster": int(label), "Num_Comments": int(sizes_per_cluster[chunk_start + k]),
+                         **ngram_columns(phrases, sizes)})
+    print(f"[keywords] {len(clusters)} clusters, {len(terms)} candidate terms in {time.time() - start:.1f}s")
+    return pd.DataFrame(rows, columns=columns)
@@ -0,0 +1,114 @@
+import os
+import json
+import sqlite3
+import hashlib
+from functools import lru_cache
+
+# Relative to src/ and notebooks/ alike, like the LLM cache
+cache_path = "../lemma_cache.sqlite"
+spacy_model = "en_core_web_sm"
+batch_size = 256
+n_process = os.cpu_count() or 1
+
+# Words left out of the lemmas: they are in almost every analysis
+custom_stopwords = {"armenia", "armenian", "armenians", "cultural", "heritage", "historical", "history"}
+
+# Only what the rule-based lemmatizer needs (tok2vec -> tagger ->
+# attribute_ruler -> lemmatizer); stop words and punctuation are lexical
+excluded_components = ["parser", "ner", "senter"]
+
+
+# ----------------------------
+# Batched, cached lemmatization
+# ----------------------------
+# The lemmatized_text of an analysis only depends on the text, the spaCy model
+# and the stop words, so it is stored under a hash of the three: texts
+# lemmatized by an earlier run (or another notebook) are looked up, and only
+# the new ones go through nlp.pipe, on n_process processes.
+
+@lru_cache(maxsize=None)
+def load_nlp(model_name=spacy_model):
+    import spacy
+
+    return spacy.load(model_name, exclude=excluded_components)
+
+
+def doc_lemmas(doc, stopwords=custom_stopwords):
+    # stop words, punctuation, custom stop words and short lemmas dropped in the same pass
+    tokens = []
+    for token in doc:
+        lemma = token.lemma_.lower()
+        if not token.is_stop and not token.is_punct and lemma not in stopwords and len(lemma) > 2:
+            tokens.append(lemma)
+    return " ".join(tokens)
+
+
+class LemmaCache:
+    def __init__(self, path=cache_path):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS lemmas (key TEXT PRIMARY KEY, lemmas TEXT)")
+        self._conn.commit()
+
+    @staticmethod
+    def settings_key(model_name, stopwords):
+        import spacy
+
+        return json.dumps([model_name, spacy.__version__, sorted(stopwords)])
+
+    @staticmethod
+    def make_key(settings, text):
+        return hashlib.sha256(f"{settings}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys, chunk=500):
+        found = {}
+        for start in range(0, len(keys), chunk):
+            part = keys[start:start + chunk]
+            rows = self._conn.execute(
+                f"SELECT key, lemmas FROM lemmas WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            found.update(rows)
+        return found
+
+    def put_many(self, items):
+        self._conn.executemany("INSERT OR REPLACE INTO lemmas (key, lemmas) VALUES (?, ?)", items)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+def lemmatize_texts(texts, model_name=spacy_model, stopwords=custom_stopwords, n_process=n_process,
+                    batch_size=batch_size, cache=None):
+    """
+    texts: analysis texts
+    cache: a LemmaCache (one at cache_path is opened otherwise)
+
+    Returns: list of lemmatized texts (space-joined lemmas), in the order of texts.
+    """
+    texts = list(texts)
+    own_cache = cache is None
+    cache = cache or LemmaCache()
+    settings = LemmaCache.settings_key(model_name, stopwords)
+    keys = [LemmaCache.make_key(settings, text) for text in texts]
+    distinct = list(set(keys))
+    lemmas = cache.get_many(distinct)
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in lemmas and key not in missing:
+            missing[key] = text
+    if missing:
+        nlp = load_nlp(model_name)
+        # process start-up is not worth it for a few batches
+        processes = max(1, min(n_process, len(missing) // batch_size))
+        docs = nlp.pipe(missing.values(), batch_size=batch_size, n_process=processes)
+        new = [(key, doc_lemmas(doc, stopwords)) for key, doc in zip(missing, docs)]
+        cache.put_many(new)
+        lemmas.update(new)
+    print(f"[lemmas] {len(texts)} texts, {len(distinct)} distinct: {len(distinct) - len(missing)} from the cache, "
+          f"{len(missing)} lemmatized")
+    if own_cache:
+        cache.close()
+    return [lemmas[key] for key in keys]
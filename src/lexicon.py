@@ -0,0 +1,182 @@
+import re
+import json
+from collections import defaultdict
+
+# ----------------------------
+# Weaponisation lexicon
+# ----------------------------
+# The example terms of the detection prompt, by perspective, and the topic
+# stems that make any change worth sending to the LLM. Matching is done on
+# lowercased text, and stems match as word prefixes ("occup" hits "occupied").
+
+PROMPT_TERMS = {
+    "armenian": [
+        "armenian genocide",
+        "historical armenian lands",
+        "western armenia",
+        "cultural erasure of armenians",
+        "destruction of khachkars",
+        "ethnic cleansing of armenians",
+        "ancient armenian monasteries",
+        "armenian heritage sites",
+        "forced demographic changes",
+    ],
+    "rival": [
+        "so-called armenian genocide",
+        "alleged genocide",
+        "disputed genocide",
+        "turkish–armenian relocation",
+        "turkish-armenian relocation",
+        "1915 deportations",
+        "caucasian albanian",
+        "illegal occupation",
+        "liberation of azerbaijani lands",
+        "fabricated armenian claims",
+        "armenian aggression",
+        "armenian terrorism",
+        "destruction of azerbaijani cultural sites",
+    ],
+}
+
+TOPIC_STEMS = [
+    "armen", "turk", "azer", "azeri", "karabakh", "karabagh", "artsakh", "nakhchivan", "nakhichevan",
+    "julfa", "jugha", "khachkar", "genocid", "massacr", "deport", "relocat", "cleansing", "ethnic",
+    "occup", "liberat", "albania", "ottoman", "kurd", "asala", "terror", "aggress", "so-called",
+    "alleged", "disputed", "fabricat", "eras", "destr", "demolish", "vandal", "heritage", "monaster",
+    "church", "mosque", "cemeter", "homeland", "indigenous", "invader",
+]
+
+_STEM_PATTERN = re.compile(r"(?<!\w)(?:" + "|".join(re.escape(s) for s in sorted(TOPIC_STEMS, key=len, reverse=True)) + ")")
+
+
+def lexicon_hits(text):
+    """
+    Returns: sorted list of the prompt terms and topic stems found in text.
+    """
+    text = text.lower()
+    hits = {term for terms in PROMPT_TERMS.values() for term in terms if term in text}
+    hits.update(match.group(0) for match in _STEM_PATTERN.finditer(text))
+    return sorted(hits)
+
+
+# ----------------------------
+# Multilingual term groups
+# ----------------------------
+# Each group is one contested concept, with its wording in the languages the
+# articles and edit comments use. FLIP_PAIRS are the concepts whose swap is a
+# stance change (e.g. "Armenian Genocide" -> "so-called"). Both can be
+# replaced by a JSON file {"groups": {...}, "flip_pairs": [[a, b], ...]}.
+
+TERM_GROUPS = {
+    "armenian_genocide": [
+        "armenian genocide", "genocide of armenians", "ermeni soykırımı", "erməni soyqırımı",
+        "հայոց ցեղասպանություն", "геноцид армян", "génocide arménien", "völkermord an den armeniern",
+    ],
+    "genocide_denial": [
+        "so-called", "alleged genocide", "alleged armenian genocide", "disputed genocide", "armenian allegations",
+        "sözde", "ermeni iddiaları", "sözdə", "erməni iddiaları", "так называемый геноцид",
+    ],
+    "relocation_1915": [
+        "1915 deportations", "turkish–armenian relocation", "turkish-armenian relocation", "relocation of armenians",
+        "tehcir", "1915 olayları",
+    ],
+    "western_armenia": [
+        "western armenia", "historical armenian lands", "historic armenia", "արևմտյան հայաստան", "западная армения",
+    ],
+    "julfa_khachkars": [
+        "khachkar", "julfa cemetery", "jugha", "ջուղա", "хачкар", "джульфинское кладбище",
+    ],
+    "caucasian_albanian": [
+        "caucasian albania", "albanian church", "albanian heritage", "qafqaz albaniya", "alban", "кавказская албания",
+        "албанск",
+    ],
+    "artsakh": ["artsakh", "արցախ", "арцах"],
+    "karabakh": ["karabakh", "karabagh", "qarabağ", "карабах"],
+    "occupation": [
+        "occupation of karabakh", "occupied territories", "illegal occupation", "armenian occupation",
+        "işğal", "işgal", "оккупац",
+    ],
+    "liberation": [
+        "liberation of azerbaijani lands", "liberated territories", "liberation of karabakh", "azad edilmiş",
+        "azad olunmuş", "освобожд",
+    ],
+    "armenian_aggression": [
+        "armenian aggression", "armenian terrorism", "armenian terrorist", "erməni təcavüzü", "erməni terroru",
+        "ermeni terörü", "армянская агрессия",
+    ],
+    "ethnic_cleansing": ["ethnic cleansing", "etnik təmizləmə", "etnik temizlik", "этническая чистка"],
+    "cultural_erasure": ["cultural erasure", "cultural genocide", "erasure of armenian", "destruction of armenian"],
+}
+
+FLIP_PAIRS = [
+    ("armenian_genocide", "genocide_denial"),
+    ("armenian_genocide", "relocation_1915"),
+    ("artsakh", "karabakh"),
+    ("occupation", "liberation"),
+    ("julfa_khachkars", "caucasian_albanian"),
+]
+
+
+def load_lexicon(path=None):
+    """
+    Returns: (groups, flip_pairs), from a JSON file or the built-in lexicon.
+    """
+    if path is None:
+        return TERM_GROUPS, FLIP_PAIRS
+    with open(path, "r", encoding="utf-8") as f:
+        lexicon = json.load(f)
+    return lexicon["groups"], [tuple(pair) for pair in lexicon.get("flip_pairs", [])]
+
+
+class TermMatcher:
+    """
+    Counts the hits of every term group in a text in one pass. Uses an
+    Aho-Corasick automaton (pyahocorasick) when installed, one compiled regex
+    alternation otherwise; both give the same counts. Terms match
+    case-insensitively at the start of a word, and at each position only the
+    longest term counts ("so-called armenian genocide" hits genocide_denial
+    and armenian_genocide once each).
+    """
+
+    def __init__(self, groups):
+        self.groups = list(groups)
+        self._term_groups = defaultdict(list)
+        for k, group in enumerate(self.groups):
+            for term in groups[group]:
+                self._term_groups[term.casefold()].append(k)
+        terms = sorted(self._term_groups, key=len, reverse=True)
+        try:
+            import ahocorasick
+            self._automaton = ahocorasick.Automaton()
+            for term in terms:
+                self._automaton.add_word(term, term)
+            self._automaton.make_automaton()
+            self._pattern = None
+        except ImportError:
+            self._automaton = None
+            # the lookahead lets matches overlap, like the automaton's
+            self._pattern = re.compile(r"(?<!\w)(?=(" + "|".join(re.escape(t) for t in terms) + "))")
+
+    def _terms(self, text):
+        if self._automaton is None:
+            return [match.group(1) for match in self._pattern.finditer(text)]
+        longest = {}
+        for end, term in self._automaton.iter(text):
+            start = end - len(term) + 1
+            if (start == 0 or not _is_word_char(text[start - 1])) and len(term) > len(longest.get(start, "")):
+                longest[start] = term
+        return list(longest.values())
+
+    def counts(self, text):
+        """
+        Returns: list with the number of hits of each group, in self.groups order.
+        """
+        counts = [0] * len(self.groups)
+        for term in self._terms(text.casefold()):
+            for k in self._term_groups[term]:
+                counts[k] += 1
+        return counts
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == "_"
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+
+from record_stream import iter_jsonl
+
+# OpenAI Batch API limits per input file
+max_requests_per_file = 50000
+max_bytes_per_file = 190 * 1024 * 1024
+poll_interval = 60
+
+
+# ----------------------------
+# OpenAI Batch API mode
+# ----------------------------
+# For full-corpus runs latency does not matter: rendered prompts are written as
+# Batch API request files, submitted, polled, and the results are stored in the
+# shared LLMCache under the same key an interactive call would use. The usual
+# output code then renders _analysis.txt / CSV files from cache hits, and
+# re-running only resubmits what is not cached yet (e.g. failed requests).
+#
+# Every step is recorded in <work_dir>/batch_state.json so a crashed run picks
+# up the submitted batches instead of paying for them twice. Pointing the
+# client's base_url at batch_stub_server.py runs the whole flow offline.
+
+def chat_body(model, system_prompt, prompt, temperature=0, max_tokens=300, **kwargs):
+    body = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    body.update(kwargs)
+    return body
+
+
+def responses_body(model, prompt):
+    return {"model": model, "input": prompt}
+
+
+def cache_key_for(cache, url, body):
+    # Must match cached_chat_completion / cached_response / AsyncLLMEngine.chat
+    if url == "/v1/responses":
+        return cache.make_key(body["model"], None, None, "", body["input"])
+    extra = {k: v for k, v in body.items() if k not in ("model", "messages", "temperature", "max_tokens")}
+    prompt = body["messages"][1]["content"]
+    return cache.make_key(body["model"], body["temperature"], body["max_tokens"], body["messages"][0]["content"],
+                          [prompt, extra] if extra else prompt)
+
+
+def write_batch_requests(requests, work_dir, url="/v1/chat/completions", cache=None):
+    """
+    requests: iterable of (custom_id, body), e.g. custom_id "<source>:<record index>"
+    cache: optional LLMCache; requests it already answers are skipped
+
+    Returns: list of request file paths (split to stay within the Batch API limits).
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    paths = []
+    out = None
+    count = size = skipped = 0
+    for custom_id, body in requests:
+        if cache is not None and cache.contains(cache_key_for(cache, url, body)):
+            skipped += 1
+            continue
+        line = json.dumps({"custom_id": custom_id, "method": "POST", "url": url, "body": body}, ensure_ascii=False) + "\n"
+        encoded = line.encode("utf-8")
+        if out is None or count >= max_requests_per_file or size + len(encoded) > max_bytes_per_file:
+            if out is not None:
+                out.close()
+            paths.append(os.path.join(work_dir, f"requests_{len(paths):04d}.jsonl"))
+            out = open(paths[-1], "wb")
+            count = size = 0
+        out.write(encoded)
+        count += 1
+        size += len(encoded)
+    if out is not None:
+        out.close()
+    print(f"[batch] Wrote {len(paths)} request files ({skipped} requests already cached)")
+    return paths
+
+
+def _load_state(work_dir):
+    state_path = os.path.join(work_dir, "batch_state.json")
+    if os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def _save_state(work_dir, state):
+    state_path = os.path.join(work_dir, "batch_state.json")
+    with open(state_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(state_path + ".tmp", state_path)
+
+
+def submit_batches(client, request_paths, work_dir, url="/v1/chat/completions"):
+    state = _load_state(work_dir)
+    for path in request_paths:
+        name = os.path.basename(path)
+        if name in state and state[name].get("batch_id"):
+            continue  # already submitted by an earlier run
+        with open(path, "rb") as f:
+            uploaded = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(input_file_id=uploaded.id, endpoint=url, completion_window="24h")
+        state[name] = {"input_file_id": uploaded.id, "batch_id": batch.id, "status": batch.status}
+        _save_state(work_dir, state)
+        print(f"[batch] Submitted {name} as {batch.id}")
+    return state
+
+
+def wait_for_batches(client, work_dir):
+    state = _load_state(work_dir)
+    # entries are refreshed at least once, to pick up their output / error files
+    pending = {name for name, entry in state.items()
+               if entry["status"] not in ("completed", "failed", "expired", "cancelled") or "output_file_id" not in entry}
+    while pending:
+        for name in sorted(pending):
+            batch = client.batches.retrieve(state[name]["batch_id"])
+            state[name]["status"] = batch.status
+            state[name]["output_file_id"] = batch.output_file_id
+            state[name]["error_file_id"] = batch.error_file_id
+            counts = batch.request_counts
+            if counts is not None:
+                print(f"[batch] {name}: {batch.status} ({counts.completed}/{counts.total} done, {counts.failed} failed)")
+            if batch.status in ("completed", "failed", "expired", "cancelled"):
+                pending.discard(name)
+        _save_state(work_dir, state)
+        if pending:
+            time.sleep(poll_interval)
+    return state
+
+
+def download_results(client, work_dir):
+    state = _load_state(work_dir)
+    result_paths = []
+    for name, entry in state.items():
+        for kind in ("output", "error"):
+            file_id = entry.get(f"{kind}_file_id")
+            if not file_id:
+                continue
+            path = os.path.join(work_dir, name.replace("requests_", f"{kind}s_"))
+            if not os.path.exists(path):
+                content = client.files.content(file_id)
+                with open(path + ".tmp", "wb") as f:
+                    f.write(content.read())
+                os.replace(path + ".tmp", path)
+            result_paths.append(path)
+    return result_paths
+
+
+def _response_text(url, body):
+    if url == "/v1/responses":
+        # the raw body has no output_text convenience field
+        return "".join(
+            part.get("text", "")
+            for item in body.get("output", []) if item.get("type") == "message"
+            for part in item.get("content", []) if part.get("type") == "output_text"
+        )
+    return body["choices"][0]["message"]["content"].strip()
+
+
+def ingest_results(request_paths, result_paths, cache, url="/v1/chat/completions"):
+    """
+    Maps every result back to its request by custom_id and stores the response
+    in the cache. Returns: dict custom_id -> error message for failed requests.
+    """
+    keys = {}
+    for path in request_paths:
+        for request in iter_jsonl(path):
+            keys[request["custom_id"]] = cache_key_for(cache, url, request["body"])
+
+    errors = {}
+    stored = 0
+    for path in result_paths:
+        for result in iter_jsonl(path):
+            custom_id = result["custom_id"]
+            response = result.get("response") or {}
+            if response.get("status_code") == 200 and custom_id in keys:
+                body = response["body"]
+                cache.put(keys[custom_id], body.get("model", ""), _response_text(url, body))
+                stored += 1
+            else:
+                error = result.get("error") or response.get("body", {}).get("error") or {}
+                errors[custom_id] = f"Error during API call: {error.get('message', 'missing from batch results')}"
+    print(f"[batch] Cached {stored} results, {len(errors)} failed")
+    return errors
+
+
+def _complete_batches(client, work_dir, cache, url):
+    # Poll, download and cache everything recorded in the state, then archive
+    # the run's request / result files under <work_dir>/run_<timestamp>
+    state = _load_state(work_dir)
+    request_paths = [os.path.join(work_dir, name) for name in sorted(state)]
+    wait_for_batches(client, work_dir)
+    result_paths = download_results(client, work_dir)
+    errors = ingest_results(request_paths, result_paths, cache, url)
+
+    archive_dir = os.path.join(work_dir, time.strftime("run_%Y%m%d_%H%M%S"))
+    suffix = 1
+    while os.path.exists(archive_dir + (f"_{suffix}" if suffix > 1 else "")):
+        suffix += 1
+    archive_dir += f"_{suffix}" if suffix > 1 else ""
+    os.makedirs(archive_dir)
+    for path in request_paths + result_paths + [os.path.join(work_dir, "batch_state.json")]:
+        os.replace(path, os.path.join(archive_dir, os.path.basename(path)))
+    return errors
+
+
+def run_batch(client, requests, work_dir, cache, url="/v1/chat/completions"):
+    """
+    Full Batch API round trip: write, submit, poll, download and cache.
+    Returns: dict custom_id -> error message for failed requests.
+    """
+    if _load_state(work_dir):
+        # batches of an interrupted run go first, so their results are cached
+        # (and not written again) below
+        print("[batch] Resuming batches of an earlier run")
+        _complete_batches(client, work_dir, cache, url)
+
+    request_paths = write_batch_requests(requests, work_dir, url, cache)
+    if not request_paths:
+        return {}
+    submit_batches(client, request_paths, work_dir, url)
+    return _complete_batches(client, work_dir, cache, url)
@@ -0,0 +1,161 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Shared by every LLM stage; relative to src/ and notebooks/ alike
+cache_path = "../llm_cache.sqlite"
+# Least recently used judgments are evicted beyond this size
+max_cache_bytes = 2 * 1024 ** 3
+
+
+# ----------------------------
+# Content-addressed LLM response cache
+# ----------------------------
+# A response is keyed by a hash of everything that determines it: model,
+# sampling parameters, system prompt and the rendered prompt. Re-running a stage
+# after a crash or an unrelated code change therefore only pays for the
+# requests that actually changed.
+
+class LLMCache:
+    def __init__(self, path=cache_path, max_bytes=max_cache_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # one connection shared by the worker threads of a script, serialized by
+        # the lock; separate processes coordinate through SQLite's own locking
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key TEXT PRIMARY KEY,
+                   model TEXT,
+                   response TEXT,
+                   size INTEGER,
+                   created REAL,
+                   last_used REAL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(model, temperature, max_tokens, system_prompt, prompt):
+        payload = json.dumps([model, temperature, max_tokens, system_prompt, prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def contains(self, key):
+        # no hit / miss counted, last_used untouched
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+
+    def put(self, key, model, response):
+        size = len(key) + len(response.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Other processes may have written too, so re-read the real total first
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used")
+        evicted = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": self._total_bytes,
+            }
+
+    def print_stats(self):
+        s = self.stats()
+        print(f"[cache] {s['hits']} hits, {s['misses']} misses ({s['hit_rate']:.1%} hit rate), "
+              f"{s['entries']} entries, {s['bytes'] / 1024 ** 2:.1f} MB, {s['evictions']} evicted")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ----------------------------
+# Cached API calls
+# ----------------------------
+# Only successful responses are stored; API errors propagate to the caller.
+
+def cached_chat_completion(client, cache, model, system_prompt, prompt, temperature=0, max_tokens=300, **kwargs):
+    # extra request options (e.g. response_format) are part of the key, as in
+    # AsyncLLMEngine.chat
+    key = cache.make_key(model, temperature, max_tokens, system_prompt, [prompt, kwargs] if kwargs else prompt)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        **kwargs
+    )
+    content = response.choices[0].message.content.strip()
+    cache.put(key, model, content)
+    return content
+
+
+def cached_response(client, cache, model, prompt):
+    # Same as cached_chat_completion, for the Responses API used by the
+    # technique categorization stages
+    key = cache.make_key(model, None, None, "", prompt)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    response = client.responses.create(
+        model=model,
+        input=prompt
+    )
+    content = response.output_text
+    cache.put(key, model, content)
+    return content
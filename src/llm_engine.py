@@ -0,0 +1,271 @@
+import time
+import random
+import asyncio
+
+import openai
+
+
+# Account-level budgets shared by every request of a run
+requests_per_minute = 5000
+tokens_per_minute = 2_000_000
+# Concurrency starts low and grows while requests succeed (AIMD)
+initial_concurrency = 8
+max_concurrency = 64
+# Retries on 429 / 5xx / connection errors with jittered exponential backoff
+max_retries = 8
+base_backoff = 1.0
+max_backoff = 60.0
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English / JSON text; only used for budgeting
+    return len(text) // 4 + 1
+
+
+# ----------------------------
+# Rate budget and adaptive concurrency
+# ----------------------------
+
+class RateBudget:
+    """
+    Two token buckets (requests and tokens per minute), refilled continuously.
+    Callers wait in FIFO order until both buckets can cover their request.
+    """
+
+    def __init__(self, rpm=requests_per_minute, tpm=tokens_per_minute):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens):
+        tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                self._refill()
+                if self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1
+                    self.tokens -= tokens
+                    return
+                wait = max((1 - self.requests) * 60 / self.rpm, (tokens - self.tokens) * 60 / self.tpm)
+                await asyncio.sleep(max(wait, 0.01))
+
+    def settle(self, estimated, actual):
+        # Give back (or charge) the difference once the real usage is known
+        self.tokens = min(self.tpm, self.tokens + estimated - actual)
+
+    def pause(self, seconds):
+        # A 429 means the server-side budget is exhausted: hold everyone back
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class AdaptiveConcurrency:
+    """
+    Limits in-flight requests. The limit grows by one after a full window of
+    successes and is halved on every rate-limit error.
+    """
+
+    def __init__(self, initial=initial_concurrency, maximum=max_concurrency):
+        self.limit = initial
+        self.maximum = maximum
+        self.active = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def __aexit__(self, *exc):
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= self.limit:
+            self.limit = min(self.maximum, self.limit + 1)
+            self._successes = 0
+
+    def on_throttle(self):
+        self.limit = max(1, self.limit // 2)
+        self._successes = 0
+
+
+def _retry_status(e):
+    """
+    Returns: the HTTP status (or 0 for connection errors / timeouts) if the
+    error is worth retrying, None otherwise.
+    """
+    if isinstance(e, (openai.APIConnectionError, openai.APITimeoutError)):
+        return 0
+    status = getattr(e, "status_code", None)
+    if status == 429 or (status is not None and status >= 500):
+        return status
+    return None
+
+
+def _retry_after(e):
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+# ----------------------------
+# Async request engine
+# ----------------------------
+
+class AsyncLLMEngine:
+    def __init__(self, client, cache=None, rpm=requests_per_minute, tpm=tokens_per_minute,
+                 initial=initial_concurrency, maximum=max_concurrency):
+        """
+        client: openai.AsyncOpenAI
+        cache: optional LLMCache, checked before any budget is spent
+        """
+        self.client = client
+        self.cache = cache
+        self.budget = RateBudget(rpm, tpm)
+        self.concurrency = AdaptiveConcurrency(initial, maximum)
+        self.stats = {"requests": 0, "cached": 0, "retries": 0, "throttled": 0, "failed": 0, "tokens": 0}
+
+    async def chat(self, model, system_prompt, prompt, temperature=0, max_tokens=300, **kwargs):
+        """
+        Returns: the stripped message content. Raises the last error once
+        max_retries is exhausted or on a non-retryable error.
+        """
+        if self.cache is not None:
+            # extra request options (e.g. response_format) are part of the key
+            key = self.cache.make_key(model, temperature, max_tokens, system_prompt, [prompt, kwargs] if kwargs else prompt)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.stats["cached"] += 1
+                return cached
+
+        estimated = estimate_tokens(system_prompt) + estimate_tokens(prompt) + max_tokens
+        for attempt in range(max_retries + 1):
+            await self.budget.acquire(estimated)
+            async with self.concurrency:
+                try:
+                    self.stats["requests"] += 1
+                    response = await self.client.chat.completions.create(
+                        model=model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": prompt}
+                        ],
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        **kwargs
+                    )
+                except Exception as e:
+                    status = _retry_status(e)
+                    if status is None or attempt == max_retries:
+                        self.stats["failed"] += 1
+                        raise
+                    delay = min(max_backoff, base_backoff * 2 ** attempt)
+                    delay = _retry_after(e) or random.uniform(delay / 2, delay)  # jittered
+                    if status == 429:
+                        self.stats["throttled"] += 1
+                        self.concurrency.on_throttle()
+                        self.budget.pause(delay)
+                    self.stats["retries"] += 1
+                else:
+                    self.concurrency.on_success()
+                    usage = getattr(response, "usage", None)
+                    if usage is not None:
+                        self.budget.settle(estimated, usage.total_tokens)
+                        self.stats["tokens"] += usage.total_tokens
+                    content = response.choices[0].message.content.strip()
+                    if self.cache is not None:
+                        self.cache.put(key, model, content)
+                    return content
+            await asyncio.sleep(delay)
+
+    def print_stats(self):
+        s = self.stats
+        print(f"[engine] {s['requests']} requests ({s['cached']} served from cache), {s['retries']} retries, "
+              f"{s['throttled']} rate-limited, {s['failed']} failed, {s['tokens']} tokens, "
+              f"final concurrency {self.concurrency.limit}")
+
+
+# ----------------------------
+# Ordered scheduling across files
+# ----------------------------
+
+async def run_ordered(sources, handle, write, finish=None, max_pending=512, num_workers=max_concurrency):
+    """
+    sources: dict name -> iterable of items (e.g. iter_jsonl(file)); items of all
+             sources are interleaved onto the same workers
+    handle:  async fn(item) -> result
+    write:   fn(name, idx, item, result), called in item order for each source
+    finish:  optional fn(name, count), called once a source is fully written
+
+    At most max_pending items are in flight or waiting for an earlier item of
+    their source, so memory stays bounded however large the sources are.
+    """
+    queue = asyncio.Queue(maxsize=num_workers)
+    window = asyncio.Semaphore(max_pending)
+    buffers = {name: {} for name in sources}
+    next_idx = {name: 1 for name in sources}
+    totals = {}  # name -> number of items, once the source is exhausted
+
+    def flush(name):
+        buffer = buffers[name]
+        while next_idx[name] in buffer:
+            idx = next_idx[name]
+            item, result = buffer.pop(idx)
+            write(name, idx, item, result)
+            next_idx[name] += 1
+            window.release()
+        if name in totals and next_idx[name] > totals[name]:
+            if finish is not None:
+                finish(name, totals[name])
+            del totals[name]
+
+    async def produce():
+        # round-robin over the sources so every file progresses at once
+        iterators = {name: enumerate(items, start=1) for name, items in sources.items()}
+        while iterators:
+            for name in list(iterators):
+                try:
+                    idx, item = next(iterators[name])
+                except StopIteration:
+                    del iterators[name]
+                    totals[name] = produced[name]
+                    flush(name)
+                    continue
+                await window.acquire()
+                produced[name] = idx
+                await queue.put((name, idx, item))
+        for _ in range(num_workers):
+            await queue.put(None)
+
+    async def work():
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            name, idx, item = job
+            result = await handle(item)
+            buffers[name][idx] = (item, result)
+            flush(name)
+
+    produced = {name: 0 for name in sources}
+    await asyncio.gather(produce(), *(work() for _ in range(num_workers)))
@@ -0,0 +1,174 @@
+import threading
+
+from llm_engine import estimate_tokens
+
+# Unchanged (non-blank) lines kept on each side of a change
+context_lines = 1
+# Characters kept of each of those lines, on the side facing the change
+context_chars = 200
+# Characters kept on each side of the edited span of a modified line
+modified_chars = 150
+# first_version Content longer than this is split into several prompts
+max_content_tokens = 12000
+
+
+# ----------------------------
+# Prompt compaction
+# ----------------------------
+# The detection prompt used to embed the whole enriched record: the unified
+# Diff repeats every changed line already listed in Added_Lines / Removed_Lines
+# and carries full unchanged paragraphs as context, and first_version records
+# carry the whole article. A compact record keeps the extracted fields, short
+# excerpts of the modified lines around the edit, and only the edges of the
+# unchanged paragraphs that touch a change. A long first_version is split into
+# parts judged separately: each part pays the instruction block again, but no
+# single request grows with the article.
+
+def _clip_start(text, chars):
+    return text if len(text) <= chars else text[:chars].rstrip() + " …"
+
+
+def _clip_end(text, chars):
+    return text if len(text) <= chars else "… " + text[-chars:].lstrip()
+
+
+def _edit_window(old, new, chars=modified_chars):
+    # Excerpt of the new line around the span that differs from the old one
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    start = max(0, prefix - chars)
+    end = min(len(new), len(new) - suffix + chars)
+    return ("… " if start > 0 else "") + new[start:end].strip() + (" …" if end < len(new) else "")
+
+
+def diff_excerpts(diff_text):
+    """
+    Walks the unified diff like parse_unidiff does.
+
+    Returns: (modified, context), where modified holds an excerpt of every
+    modified line (a "-" line directly followed by a "+" line) around the
+    edit, and context holds the clipped unchanged lines next to a change.
+    """
+    # entries: ("change", None) or ("context", text); hunks are kept apart
+    hunks = [[]]
+    modified = []
+    lines = diff_text.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith('@@'):
+            hunks.append([])
+        elif line.startswith(('---', '+++')):
+            pass
+        elif line.startswith('-') and i + 1 < len(lines) and lines[i + 1].startswith('+'):
+            modified.append(_edit_window(line[1:].strip(), lines[i + 1][1:].strip()))
+            hunks[-1].append(("change", None))
+            i += 1
+        elif line.startswith(('-', '+')):
+            hunks[-1].append(("change", None))
+        elif line[1:].strip():
+            hunks[-1].append(("context", line[1:].strip()))
+        i += 1
+
+    context = []
+    for hunk in hunks:
+        # distance in unchanged lines to the previous / next change
+        since_change = _distances(hunk)
+        until_change = _distances(hunk[::-1])[::-1]
+        for (kind, text), after, before in zip(hunk, since_change, until_change):
+            after = after is not None and after <= context_lines
+            before = before is not None and before <= context_lines
+            if after and before:
+                if len(text) > 2 * context_chars:
+                    text = _clip_start(text, context_chars) + " " + _clip_end(text, context_chars)
+                context.append(text)
+            elif before:
+                context.append(_clip_end(text, context_chars))
+            elif after:
+                context.append(_clip_start(text, context_chars))
+    return modified, context
+
+
+def _distances(entries):
+    distances = []
+    distance = None
+    for kind, _ in entries:
+        if kind == "change":
+            distance = 0
+            distances.append(None)
+        else:
+            distance = None if distance is None else distance + 1
+            distances.append(distance)
+    return distances
+
+
+def split_content(content, max_tokens=max_content_tokens):
+    # Paragraph-aligned parts of at most max_tokens (estimated) each; a single
+    # oversized paragraph is cut by characters
+    max_chars = max_tokens * 4
+    parts = []
+    current = ""
+    for paragraph in content.split("\n"):
+        while len(paragraph) > max_chars:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and estimate_tokens(current + "\n" + paragraph) > max_tokens:
+            parts.append(current)
+            current = ""
+        current = current + "\n" + paragraph if current else paragraph
+    if current.strip() or not parts:
+        parts.append(current)
+    return parts
+
+
+def compact_records(record):
+    """
+    record: an enriched record (Added_* / Removed_* already set for diffs)
+
+    Returns: list of compact records to judge, usually one; a long
+    first_version is split into parts ("Part": "i/n").
+    """
+    if record.get("version") == "diff":
+        compact = dict(record)
+        compact["Modified_Lines"], compact["Context"] = diff_excerpts(compact.pop("Diff", ""))
+        # empty fields (most lists of a small edit) are left out
+        return [{k: v for k, v in compact.items() if v not in ("", [], None)}]
+    if record.get("version") == "first_version" and estimate_tokens(record.get("Content", "")) > max_content_tokens:
+        parts = split_content(record["Content"])
+        return [dict(record, Content=part, Part=f"{k}/{len(parts)}") for k, part in enumerate(parts, start=1)]
+    return [record]
+
+
+class CompactionStats:
+    # Input tokens of the full vs the compact prompts, shared by worker threads
+    def __init__(self):
+        self.records = 0
+        self.full_tokens = 0
+        self.compact_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, full_prompt, prompts):
+        """
+        Returns: the input tokens saved for this record (estimated).
+        """
+        full = estimate_tokens(full_prompt)
+        compact = sum(estimate_tokens(p) for p in prompts)
+        with self._lock:
+            self.records += 1
+            self.full_tokens += full
+            self.compact_tokens += compact
+        return full - compact
+
+    def print_stats(self):
+        saved = self.full_tokens - self.compact_tokens
+        share = saved / self.full_tokens if self.full_tokens else 0.0
+        print(f"[compaction] {self.records} records, {self.full_tokens} -> {self.compact_tokens} input tokens "
+              f"({saved} saved, {share:.1%})")
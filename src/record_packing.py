@@ -0,0 +1,95 @@
+import threading
+from collections import Counter
+
+# Rendered record JSON per packed request (the instruction block comes on top)
+pack_budget_tokens = 2000
+# Every packed record gets its own explanation, so this bounds the answer size
+max_records_per_pack = 8
+
+
+# ----------------------------
+# Token-budget record packing
+# ----------------------------
+# Most revisions are tiny (typo fixes, single words, empty diffs) while the
+# instruction block of the detection prompt is ~900 tokens. Consecutive small
+# records are therefore sent together, each with an "id", and the answer holds
+# one judgment per id. Records above the budget are sent alone as before.
+
+def pack(items, budget=pack_budget_tokens, max_records=max_records_per_pack):
+    """
+    items: iterable of (tokens, item); tokens None for an item that must go alone
+
+    Yields: lists of items in input order, each within the budget; an item
+    above the budget is yielded alone. Items are consumed lazily.
+    """
+    current = []
+    used = 0
+    for tokens, item in items:
+        if tokens is None or tokens > budget:
+            if current:
+                yield current
+                current, used = [], 0
+            yield [item]
+            continue
+        if current and (used + tokens > budget or len(current) >= max_records):
+            yield current
+            current, used = [], 0
+        current.append(item)
+        used += tokens
+    if current:
+        yield current
+
+
+class PackingStats:
+    # Requests and input tokens of the packed requests vs one request per record
+    def __init__(self):
+        self.records = 0
+        self.requests = 0
+        self.single_tokens = 0
+        self.packed_tokens = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def add(self, records, single_tokens, packed_tokens):
+        with self._lock:
+            self.records += records
+            self.requests += 1
+            self.single_tokens += single_tokens
+            self.packed_tokens += packed_tokens
+
+    def add_fallback(self):
+        # a record missing from a packed answer, sent again on its own
+        with self._lock:
+            self.fallbacks += 1
+
+    def print_stats(self):
+        saved = self.single_tokens - self.packed_tokens
+        print(f"[packing] {self.records} records in {self.requests} packed requests, "
+              f"{saved} input tokens saved, {self.fallbacks} records re-sent alone")
+
+
+def compare_judgments(single, packed):
+    """
+    single, packed: dict record id -> judgment label for the same records
+
+    Returns: dict with the agreement rate, a Counter of (single, packed) label
+    pairs and the ids of the records judged differently.
+    """
+    ids = sorted(single.keys() & packed.keys())
+    pairs = Counter((single[i], packed[i]) for i in ids)
+    disagreements = [i for i in ids if single[i] != packed[i]]
+    return {
+        "records": len(ids),
+        "agreement": 1 - len(disagreements) / len(ids) if ids else 0.0,
+        "pairs": pairs,
+        "disagreements": disagreements,
+    }
+
+
+def print_comparison(comparison):
+    print(f"[packing] {comparison['records']} records, {comparison['agreement']:.1%} same judgment "
+          f"packed vs single")
+    for (single, packed), count in sorted(comparison["pairs"].items()):
+        print(f"    single {single!r:18} packed {packed!r:18} {count}")
+    if comparison["disagreements"]:
+        print(f"    differing records: {comparison['disagreements']}")
@@ -0,0 +1,159 @@
+import os
+import json
+
+
+# ----------------------------
+# Streaming record readers / writers
+# ----------------------------
+# Every stage of the pipeline works on one revision at a time, so records are
+# yielded lazily instead of being collected into lists. Peak memory therefore
+# stays at roughly one record no matter how long an article's history is.
+
+def iter_jsonl(filepath):
+    with open(filepath, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_jsonl_range(filepath, start, end):
+    # Records whose line starts within the byte range [start, end). start must
+    # be the beginning of a line (see split_jsonl).
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                yield json.loads(line)
+
+
+def split_jsonl(filepath, chunk_bytes, start=0, end=None):
+    """
+    Cuts the byte range [start, end) of a JSONL file (the whole file by default)
+    into consecutive ranges of roughly chunk_bytes, aligned on line boundaries,
+    so each range holds a contiguous run of records. Only seeks, the file is
+    not scanned.
+
+    Returns: list of (start, end) byte offsets.
+    """
+    if end is None:
+        end = os.path.getsize(filepath)
+    boundaries = [start]
+    with open(filepath, "rb") as f:
+        while boundaries[-1] + chunk_bytes < end:
+            f.seek(boundaries[-1] + chunk_bytes)
+            f.readline()  # skip to the start of the next record
+            if f.tell() >= end:
+                break
+            boundaries.append(f.tell())
+    boundaries.append(end)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def last_record_end(filepath):
+    """
+    Returns: byte offset just past the last complete record. A trailing line
+    that is neither newline-terminated nor valid JSON is treated as still being
+    written and excluded.
+    """
+    size = os.path.getsize(filepath)
+    with open(filepath, "rb") as f:
+        pos = size
+        while pos > 0:
+            step = min(1 << 16, pos)
+            f.seek(pos - step)
+            k = f.read(step).rfind(b"\n")
+            if k != -1:
+                line_end = pos - step + k + 1
+                break
+            pos -= step
+        else:
+            line_end = 0
+        if line_end == size:
+            return size
+        f.seek(line_end)
+        try:
+            json.loads(f.read())
+            return size
+        except ValueError:
+            return line_end
+
+
+def last_record(filepath, end):
+    # Last non-blank record ending at or before the byte offset end
+    with open(filepath, "rb") as f:
+        pos = end
+        tail = b""
+        while pos > 0:
+            step = min(1 << 16, pos)
+            f.seek(pos - step)
+            tail = f.read(step) + tail
+            pos -= step
+            lines = tail.split(b"\n")
+            # lines[0] may be cut off unless the start of the file was reached
+            complete = lines if pos == 0 else lines[1:]
+            for line in reversed(complete):
+                if line.strip():
+                    return json.loads(line)
+    return None
+
+
+def iter_csv(filepath, chunksize=1000):
+    # pandas is only needed by the CSV-based stages, so import it lazily
+    import pandas as pd
+
+    for chunk in pd.read_csv(filepath, encoding="utf-8", chunksize=chunksize):
+        yield from chunk.to_dict(orient="records")
+
+
+def count_records(filepath):
+    count = 0
+    with open(filepath, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                count += 1
+    return count
+
+
+def save_jsonl(filepath, records):
+    """
+    records: any iterable of dicts (typically a generator)
+
+    Writes the records one by one to a temporary file that is moved into place
+    once the stream is exhausted, so a failure mid-way never leaves a truncated
+    output behind.
+
+    Returns: number of records written.
+    """
+    tmp_path = filepath + ".tmp"
+    count = 0
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, filepath)
+    return count
+
+
+def save_lines(filepath, lines):
+    # Same as save_jsonl, for already formatted text blocks (e.g. analysis results)
+    tmp_path = filepath + ".tmp"
+    count = 0
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write(line)
+                count += 1
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, filepath)
+    return count
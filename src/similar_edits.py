@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from embedding_store import EmbeddingStore, default_model
+
+# Relative to src/ and notebooks/ alike
+index_directory = "../similar_edits"
+input_directory = "../csv_files"
+clusters_path = "../data/weaponization_analysis/UPDATED_clusters_with_reduced_weaponization_techniques_named.csv"
+
+# HNSW parameters: more links / a larger candidate list = better recall, slower queries
+hnsw_m = 32
+ef_construction = 200
+ef_search = 128
+# Filters leaving at most this many items are answered by an exact scan
+# instead of the graph, where most visited nodes would be rejected
+exact_search_limit = 20000
+
+FILTER_COLUMNS = ["kind", "source", "cluster", "stance", "technique"]
+
+
+# ----------------------------
+# Similar-edit search
+# ----------------------------
+# Every weaponised revision is indexed twice: by its analysis (what the edit
+# did) and by its changed lines (the edit itself, "kind" = "revision"). The
+# vectors are the EmbeddingStore ones, so building the index only encodes
+# texts no notebook has encoded yet. The index is an HNSW graph (hnswlib,
+# cosine) saved with a metadata table whose row number is the item id, and
+# queries are filtered on source, cluster, stance, technique and kind. The
+# stance is the Stance column of stance-aware detection runs (empty when
+# unknown); the finegrained tables come from a separate run and are not used.
+
+def revision_text(row):
+    lines = [f"+ {line}" for line in str(row.get("Added_Lines", "") or "").split(" | ") if line.strip()]
+    lines += [f"- {line}" for line in str(row.get("Removed_Lines", "") or "").split(" | ") if line.strip()]
+    return "\n".join(lines)
+
+
+def build_items(input_dir=input_directory, clusters_path=clusters_path):
+    """
+    Returns: DataFrame with one row per indexed text: kind, source, record,
+    cluster, stance, technique, reduced_technique and text.
+    """
+    analyses = {}
+    if os.path.exists(clusters_path):
+        clusters = pd.read_csv(clusters_path, encoding="utf-8")
+        for row in clusters.itertuples():
+            analyses[row.original_text] = {"cluster": row.cluster, "technique": row.weaponization_technique,
+                                           "reduced_technique": row.reduced_weaponization_technique}
+
+    items = []
+    for filename in sorted(os.listdir(input_dir)):
+        if not filename.endswith("_output.csv"):
+            continue
+        df = pd.read_csv(os.path.join(input_dir, filename), encoding="utf-8", keep_default_na=False)
+        df = df[df["Judgment"] == "Weaponised"]
+        source = filename.replace("_output.csv", "")
+        for idx, row in zip(df.index, df.to_dict("records")):
+            analysis = str(row["Analysis"])
+            meta = {
+                "source": source,
+                "record": row.get("Record", idx),
+                "cluster": -1,
+                "stance": row.get("Stance") or "",
+                "technique": "",
+                "reduced_technique": "",
+                **analyses.get(analysis, {}),
+            }
+            items.append({"kind": "analysis", **meta, "text": analysis})
+            text = revision_text(row)
+            if text:
+                items.append({"kind": "revision", **meta, "text": text})
+    return pd.DataFrame(items, columns=["kind", "source", "record", "cluster", "stance", "technique",
+                                        "reduced_technique", "text"])
+
+
+class SimilarEdits:
+    def __init__(self, directory=index_directory, store=None):
+        """
+        store: the EmbeddingStore the index was built from (opened from the
+        saved model name otherwise)
+        """
+        import hnswlib
+
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.items = pd.read_csv(os.path.join(directory, "items.csv"), encoding="utf-8", keep_default_na=False,
+                                 dtype={"record": str})
+        # categoricals: a filter compares small integer codes, not strings
+        for column in FILTER_COLUMNS:
+            self.items[column] = self.items[column].astype(str).astype("category")
+        self.store = store or EmbeddingStore(self.meta["model"])
+        self.rows = np.load(os.path.join(directory, "rows.npy"))
+        self.index = hnswlib.Index(space="cosine", dim=self.meta["dim"])
+        self.index.load_index(os.path.join(directory, "index.bin"), max_elements=len(self.items))
+        self.index.set_ef(ef_search)
+
+    @staticmethod
+    def build(items, store, directory=index_directory):
+        """
+        items: DataFrame from build_items
+        store: EmbeddingStore (texts not in it yet are encoded)
+        """
+        import hnswlib
+
+        start = time.time()
+        rows = store.rows(list(items["text"]))
+        vectors = store.vectors()
+        index = hnswlib.Index(space="cosine", dim=store.dim)
+        index.init_index(max_elements=len(items), ef_construction=ef_construction, M=hnsw_m)
+        # in chunks, so the float32 copy of the vectors is never whole in memory
+        for start_row in range(0, len(rows), 100000):
+            chunk = rows[start_row:start_row + 100000]
+            index.add_items(np.asarray(vectors[chunk], dtype=np.float32),
+                            np.arange(start_row, start_row + len(chunk)))
+        os.makedirs(directory, exist_ok=True)
+        index.save_index(os.path.join(directory, "index.bin"))
+        np.save(os.path.join(directory, "rows.npy"), rows)
+        items.to_csv(os.path.join(directory, "items.csv"), index=False, encoding="utf-8")
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"model": store.model_name, "dim": store.dim, "items": len(items), "M": hnsw_m,
+                       "ef_construction": ef_construction}, f, indent=2)
+        with_stance = int((items["stance"].fillna("").astype(str) != "").sum())
+        print(f"[similar] {len(items)} items indexed ({with_stance} with a stance) in {time.time() - start:.1f}s")
+
+    def _mask(self, filters):
+        mask = None
+        for column, value in filters.items():
+            if value is None:
+                continue
+            values = [str(v) for v in value] if isinstance(value, (list, tuple, set)) else [str(value)]
+            selected = self.items[column].isin(values).to_numpy()
+            mask = selected if mask is None else mask & selected
+        return mask
+
+    def _exact(self, vector, candidates, k):
+        vectors = np.asarray(self.store.vectors()[self.rows[candidates]], dtype=np.float32)
+        scores = vectors @ vector / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+        top = np.argsort(-scores)[:k]
+        return candidates[top], scores[top]
+
+    def query(self, text=None, item=None, k=10, kind=None, source=None, cluster=None, stance=None, technique=None):
+        """
+        text: a new analysis or revision text, or
+        item: the id (row of self.items) of an indexed one, left out of the results
+        kind / source / cluster / stance / technique: a value or a list of values to keep
+        (items of unknown stance never match a stance; ValueError when no item has one)
+
+        Returns: DataFrame of the k most similar items, with their similarity.
+        """
+        if stance is not None and not (self.items["stance"] != "").any():
+            raise ValueError("No indexed edit has a stance: build the index from detection output with a "
+                             "Stance column (stance_mode in LLM_detection_batch.py)")
+        if item is not None:
+            vector = np.asarray(self.store.vectors()[self.rows[item]], dtype=np.float32)
+        else:
+            vector = self.store.encode([text])[0]
+        vector = vector / max(np.linalg.norm(vector), 1e-12)
+        mask = self._mask({"kind": kind, "source": source, "cluster": cluster, "stance": stance,
+                           "technique": technique})
+        if item is not None:
+            mask = np.ones(len(self.items), dtype=bool) if mask is None else mask.copy()
+            mask[item] = False
+        allowed = len(self.items) if mask is None else int(mask.sum())
+        if allowed == 0:
+            ids, scores = np.array([], dtype=np.int64), np.array([])
+        elif mask is not None and allowed <= exact_search_limit:
+            ids, scores = self._exact(vector, np.flatnonzero(mask), k)
+        else:
+            labels, distances = self.index.knn_query(vector, k=min(k, allowed),
+                                                     filter=None if mask is None else (lambda i: mask[i]))
+            ids, scores = labels[0].astype(np.int64), 1 - distances[0]
+        result = self.items.iloc[ids].copy()
+        result.insert(0, "similarity", scores)
+        result.insert(0, "item", ids)
+        return result.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the similar-edit index over the weaponised revisions.")
+    parser.add_argument("--input-dir", default=input_directory, help="directory with the *_output.csv files")
+    parser.add_argument("--model", default=default_model, help="SentenceTransformer model")
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.model)
+    SimilarEdits.build(build_items(args.input_dir), store)
+    store.print_stats()
@@ -0,0 +1,183 @@
+import os
+import re
+import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_cache import cached_response
+
+model = "gpt-4o-mini"
+num_workers = 4
+
+
+# ----------------------------
+# Technique prompt
+# ----------------------------
+# One prompt for every table (clusters, cluster topics, general topics, and the
+# weaponised records streamed out of LLM_detection_batch.py), so the same
+# analysis text always maps to the same cache key and is only paid for once.
+
+def technique_prompt(analysis):
+    # removed for now due to overlap with the other categories:
+    # "Image and Media Manipulation": Specifically using either images, videos, maps and other types of similar media, etc. or information (captions etc.) embedded in them to reinforce or trivialize a viewpoint. Example:
+
+    prompt = f"""
+    You are an expert in political narratives, conflict studies, and cultural heritage.
+    You are currently investigating revisions on Wikipedia articles for potential weaponization of cultural heritage topics.
+    The below is the analysis of one such revision already made earlier in the pipeline. It is a given that the original revision has employed weaponization.
+    Your task is to choose, among the given list of weaponization techniques, the ONE most likely weaponization technique the original revision employed.
+    Full list of weaponization techniques to choose from as well as their exact definition (and example) in this context (LIMITED TO THESE OPTIONS, NO OTHER):
+            "Terminology Biasing": Swapping neutral, or standard, or slanted-towards-one-side terms (for names, titles, exonyms, etc.) for alternatives culturally/ideologically slanted towards another side. Examples: "Armenian Genocide" vs. "Armenian Relocation" vs. "so-called Armenian Genocide", etc.
+            "Euphemism and Doublespeak": Replacing direct language with softer phrasing to obscure meaning. Example: revision changing "official state denial of the Armenian Genocide" to "that is considered by many historians as official state denial of the Armenian Genocide", or revision changing "denying the Armenian Genocide" to "disputing the appropriateness of the Genocide label."
+            "Selective Omission": Deleting inconvenient facts, dates, or events in the text proper to skew the narrative. Example: revision deleting significant passage that details the rounding up and imprisonment of Armenian intellectuals during the events of April 1915, or revision removing the line `[[Category:Genocides in Asia]]` when it comes to the Armenian Genocide article.
+            "Selective Insertion": Adding one-sided or fringe claims/ facts in the text proper that favor a particular agenda. Example: revision adding "===Websites supporting the genocide theses===" including an entire series of links to pro-Armenian websites; or revision claiming that "No Turkish state official has visited Tsitsernakaberd.".
+            "Source Biasing": Replacing reputable citations with partisan (no matter how verifiable or otherwise) ones. Example: revision replacing a reference to a source that provided a more general context about the Armenian Genocide with a specific citation from Dennis Papazian's book, "What Every Armenian Should Know."
+            "Citation Washing": Bulk-adding irrelevant or low-quality citations to fake credibility. Example: adding multiple low-quality sources (e.g., blogs, self-published sources, etc.) to support Turkish/Armenian claims.
+            "Citation Deletion": Removing citations to make opposing views appear less verifiable. Example: removing a citation to Michael M. Gunter's work on "Armenian Terrorism" by claiming him as a "genocide denialist" without evidence.
+            "Tag Manipulation": Adding or removing specific Wikipedia tags (e.g., "neutrality disputed", "citation needed", etc.) to influence readers' perception of the article's credibility or bias. Example: revisions adding or removing "neutral point of view" tags on articles related to the Armenian Genocide, or addition/removal of the "msg:TotallyDisputed" tag, among others.
+            "Glorification & Vilification": Portraying own or friendly subjects as more heroic, justified, and righteous, etc; and/or Portraying opposing subjects to oneself/"enemies" as more evil, wicked, barbaric, etc.; via loaded and emotionally appealing language. Examples: revision claiming that Armenians "were mean people and hated americans."; or revisions adding references to "MASSACRE BY TURKS IN CAUCASUS TOWNS" and in the process highlight Turkish atrocities while emotionally highlighting Armenian victimhood.
+            "Timeline Rewriting": Shifting dates or sequences to alter causality or responsibility. Example: revision changing changes the date range of the Armenian Genocide from "1915-1916" to "1915-1922.", or revision changing the April 24 arrest of Armenian intellectuals in 1915 from as simple "an event during the Armenian Genocide" to "the first major event of the Armenian Genocide".
+
+    Analysis of the revision to categorize: {analysis}
+
+    Answer ONLY with the name of the chosen technique exactly as is - NO explanations or definitions.
+    """
+    return prompt
+
+
+def technique_definitions():
+    """
+    Returns: dict technique name -> definition (with example), as listed in
+    technique_prompt.
+    """
+    definitions = {}
+    for line in technique_prompt("").splitlines():
+        match = re.match(r'\s+"([^"]+)": (.+)$', line)
+        if match:
+            definitions[match.group(1)] = match.group(2).strip()
+    return definitions
+
+
+def clean_technique(output_text):
+    # make sure there is no quotation marks or extra spaces
+    return output_text.strip().replace('"', '').replace("'", "")
+
+
+# ----------------------------
+# Shared, deduplicating categorizer
+# ----------------------------
+
+class TechniqueCategorizer:
+    """
+    Names the technique of analysis texts on a thread pool. Every distinct
+    text is sent once per run: later requests for the same text (from another
+    table, or while the first call is still in flight) share its future, and
+    texts categorized by earlier runs come from the LLM cache.
+    """
+
+    def __init__(self, client, cache, model=model, num_workers=num_workers):
+        self.client = client
+        self.cache = cache
+        self.model = model
+        self.requested = 0
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=num_workers)
+
+    def name_technique(self, analysis):
+        return clean_technique(cached_response(self.client, self.cache, self.model, technique_prompt(analysis)))
+
+    def submit(self, analysis):
+        """
+        Returns: a Future of the technique name; returns at once.
+        """
+        with self._lock:
+            self.requested += 1
+            future = self._futures.get(analysis)
+            if future is None:
+                future = self._executor.submit(self.name_technique, analysis)
+                self._futures[analysis] = future
+            return future
+
+    def categorize(self, texts):
+        """
+        Returns: list of technique names, in the order of texts.
+        """
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def print_stats(self):
+        unique = len(self._futures)
+        print(f"[techniques] {self.requested} texts, {unique} distinct "
+              f"({self.requested - unique} duplicates not sent again)")
+
+
+def categorize_tables(categorizer, tables, column="original_text", guesses=None):
+    """
+    tables: dict output path -> DataFrame, each with the analysis texts in column
+    guesses: dict text -> technique already settled without the LLM (see
+    technique_scoring.TechniqueScorer.guesses); these texts are not sent
+
+    Every text of every table is submitted before the first one is waited on,
+    so texts shared by several tables are only categorized once. Each table is
+    written with a "weaponization_technique" column (and "technique_source",
+    "embedding" or "llm", when guesses are given).
+    """
+    scored = guesses is not None
+    guesses = guesses or {}
+    futures = {output_path: [None if text in guesses else categorizer.submit(text) for text in df[column]]
+               for output_path, df in tables.items()}
+    for output_path, df in tables.items():
+        df["weaponization_technique"] = [guesses[text] if future is None else future.result()
+                                         for text, future in zip(df[column], futures[output_path])]
+        if scored:
+            df["technique_source"] = ["embedding" if text in guesses else "llm" for text in df[column]]
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        df.to_csv(output_path, index=False)
+        print(f"Saved the analysis results to {output_path}")
+
+
+# ----------------------------
+# Streaming from the detection stage
+# ----------------------------
+
+class TechniqueStream:
+    """
+    Categorizes the weaponised records of one source while detection is still
+    running. add() only submits; rows are written to output_path (JSONL) in
+    record order as soon as their technique is in, and close() waits for the
+    rest.
+    """
+
+    def __init__(self, categorizer, output_path):
+        self.categorizer = categorizer
+        self.output_path = output_path
+        self.count = 0
+        self._pending = deque()
+        self._file = open(output_path + ".tmp", "w", encoding="utf-8")
+
+    def add(self, row):
+        # row: a judgment row (see judgments.judgment_row)
+        self._pending.append((row, self.categorizer.submit(row["Analysis"])))
+        self._drain(block=False)
+
+    def _drain(self, block):
+        while self._pending and (block or self._pending[0][1].done()):
+            row, future = self._pending.popleft()
+            try:
+                technique = future.result()
+            except Exception as e:
+                technique = f"Error during API call: {e}"
+            record = {"Source": row["Source"], "Record": row["Record"], "original_text": row["Analysis"],
+                      "weaponization_technique": technique}
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.count += 1
+
+    def close(self):
+        self._drain(block=True)
+        self._file.close()
+        os.replace(self.output_path + ".tmp", self.output_path)
@@ -0,0 +1,128 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+from technique_categorization import technique_definitions
+
+top_k = 3
+# Texts whose best technique beats the second one by less cosine similarity
+# than this are left to the LLM (name_technique)
+min_margin = 0.05
+# Rows scored per matrix product
+score_chunk = 50000
+# For evaluate_margins: analyses already labelled by the LLM categorizer
+labelled_path = "../data/weaponization_analysis/UPDATED_clusters_with_reduced_weaponization_techniques_named.csv"
+evaluated_margins = (0.0, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15)
+
+
+# ----------------------------
+# Zero-shot technique scoring
+# ----------------------------
+# The cosine similarity of every analysis to every technique definition of
+# technique_prompt ("Name: definition", encoded once), computed on the stored
+# analysis embeddings in batched matrix products. The best technique is taken
+# as the weaponization_technique when it clearly beats the runner-up; only the
+# close calls are sent to the LLM categorizer. min_margin is a placeholder
+# until evaluate_margins (`python technique_scoring.py`) has been run against
+# the LLM labels.
+
+def _normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class TechniqueScorer:
+    def __init__(self, store, definitions=None, min_margin=min_margin):
+        """
+        store: EmbeddingStore of the analysis texts
+        definitions: dict technique name -> definition (technique_prompt's list by default)
+        """
+        definitions = definitions or technique_definitions()
+        self.store = store
+        self.min_margin = min_margin
+        self.names = np.array(list(definitions))
+        self.vectors = _normalize(store.encode([f"{name}: {text}" for name, text in definitions.items()]))
+        self.scored = 0
+        self.confident = 0
+
+    def scores(self, embeddings):
+        """
+        Returns: float32 array (texts, techniques) of cosine similarities.
+        """
+        scores = np.empty((len(embeddings), len(self.names)), dtype=np.float32)
+        for start in range(0, len(embeddings), score_chunk):
+            chunk = np.asarray(embeddings[start:start + score_chunk], dtype=np.float32)
+            scores[start:start + score_chunk] = _normalize(chunk) @ self.vectors.T
+        return scores
+
+    def top_techniques(self, texts, k=top_k):
+        """
+        Returns: DataFrame, one row per text: technique_1..k / score_1..k (best
+        first), margin (score_1 - score_2) and confident (margin >= min_margin).
+        """
+        scores = self.scores(self.store.encode(texts))
+        k = min(k, len(self.names))
+        best = np.argsort(-scores, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        table = {}
+        for i in range(k):
+            table[f"technique_{i + 1}"] = self.names[best[:, i]]
+            table[f"score_{i + 1}"] = best_scores[:, i]
+        margin = best_scores[:, 0] - best_scores[:, 1] if k > 1 else np.ones(len(best_scores))
+        table["margin"] = margin
+        table["confident"] = margin >= self.min_margin
+        self.scored += len(scores)
+        self.confident += int(np.sum(table["confident"]))
+        return pd.DataFrame(table)
+
+    def guesses(self, texts):
+        """
+        Returns: dict text -> technique for the distinct texts scored with a
+        confident margin; the others are not in it (they need the LLM).
+        """
+        texts = list(dict.fromkeys(texts))
+        if not texts:
+            return {}
+        table = self.top_techniques(texts)
+        return {text: technique for text, technique, confident
+                in zip(texts, table["technique_1"], table["confident"]) if confident}
+
+    def print_stats(self):
+        share = self.confident / self.scored if self.scored else 0.0
+        print(f"[techniques] {self.scored} texts scored against the definitions, {self.confident} ({share:.0%}) "
+              f"with a margin of at least {self.min_margin} taken without the LLM")
+
+
+# ----------------------------
+# Evaluation against the LLM labels
+# ----------------------------
+
+def evaluate_margins(store, path=labelled_path, margins=evaluated_margins):
+    """
+    Scores the distinct analyses of path (original_text) and compares the best
+    technique with their weaponization_technique.
+
+    Returns: DataFrame, one row per margin: confident (texts at or above it),
+    share (of the labelled texts), agreement (of the confident guesses with
+    the LLM label).
+    """
+    df = pd.read_csv(path, encoding="utf-8").drop_duplicates("original_text")
+    scorer = TechniqueScorer(store, min_margin=0.0)
+    table = scorer.top_techniques(list(df["original_text"]))
+    labels = df["weaponization_technique"].to_numpy()
+    known = np.isin(labels, scorer.names)  # typos of older runs have no definition
+    agree = table["technique_1"].to_numpy() == labels
+    rows = []
+    for margin in margins:
+        confident = known & (table["margin"].to_numpy() >= margin)
+        rows.append({"min_margin": margin, "confident": int(confident.sum()),
+                     "share": confident.sum() / known.sum() if known.any() else 0.0,
+                     "agreement": agree[confident].mean() if confident.any() else float("nan")})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    from embedding_store import EmbeddingStore
+
+    # python technique_scoring.py [labelled csv]
+    print(evaluate_margins(EmbeddingStore(), *sys.argv[1:2]).to_string(index=False))
@@ -0,0 +1,178 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # the index is written as CSV instead
+    pa = None
+
+from record_stream import iter_jsonl
+from lexicon import load_lexicon, TermMatcher
+
+# Enriched revisions written by enriching.py
+input_directory = "csv_results"
+output_directory = "../term_index"
+# None for the built-in lexicon, or a JSON file (see lexicon.load_lexicon)
+lexicon_path = None
+num_workers = os.cpu_count() or 4
+# Rows per Parquet row group
+batch_rows = 50000
+
+
+# ----------------------------
+# Per-revision term hit vectors
+# ----------------------------
+# Every enriched revision gets one row: its source and record index (as in
+# the detection outputs), Timestamp and User, and for every term group the
+# number of hits on the added side (Added_Lines + Added_Words) and on the
+# removed side (Removed_Lines + Removed_Words). One file per source, so the
+# files are written in parallel and only changed sources are rescanned.
+
+_matcher = None
+
+
+def _get_matcher():
+    # one automaton per worker process
+    global _matcher
+    if _matcher is None:
+        _matcher = TermMatcher(load_lexicon(lexicon_path)[0])
+    return _matcher
+
+
+def hit_columns(groups):
+    return [f"{group}_added" for group in groups] + [f"{group}_removed" for group in groups]
+
+
+def revision_hits(matcher, record):
+    added = "\n".join(record.get("Added_Lines", []) + [" ".join(record.get("Added_Words", []))])
+    removed = "\n".join(record.get("Removed_Lines", []) + [" ".join(record.get("Removed_Words", []))])
+    return matcher.counts(added) + matcher.counts(removed)
+
+
+def index_output_path(file_path):
+    source = os.path.splitext(os.path.basename(file_path))[0].replace("_enriched", "")
+    return os.path.join(output_directory, f"{source}_terms" + (".parquet" if pa is not None else ".csv"))
+
+
+def _write_batches(output_file, batches):
+    # Streams row batches into one Parquet file (CSV without pyarrow)
+    tmp_file = output_file + ".tmp"
+    writer = None
+    for k, df in enumerate(batches):
+        if pa is None:
+            df.to_csv(tmp_file, mode="w" if k == 0 else "a", header=(k == 0), index=False, encoding="utf-8")
+            continue
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(tmp_file, table.schema)
+        writer.write_table(table)
+    if writer is not None:
+        writer.close()
+    os.replace(tmp_file, output_file)
+
+
+def index_file(file_path):
+    """
+    Returns: (file_path, number of revisions, elapsed seconds).
+    """
+    start = time.time()
+    matcher = _get_matcher()
+    columns = hit_columns(matcher.groups)
+    source = os.path.splitext(os.path.basename(file_path))[0].replace("_enriched", "")
+    count = 0
+
+    def batches():
+        nonlocal count
+        rows = []
+        for idx, record in enumerate(iter_jsonl(file_path), start=1):
+            rows.append([source, idx, record.get("version", ""), record.get("Timestamp", ""), record.get("User", "")]
+                        + revision_hits(matcher, record))
+            count = idx
+            if len(rows) >= batch_rows:
+                yield _to_frame(rows, columns)
+                rows = []
+        if rows or count == 0:
+            yield _to_frame(rows, columns)
+
+    _write_batches(index_output_path(file_path), batches())
+    return file_path, count, time.time() - start
+
+
+def _to_frame(rows, columns):
+    df = pd.DataFrame(rows, columns=["source", "record", "version", "Timestamp", "User"] + columns)
+    df[columns] = df[columns].clip(upper=65535).astype("uint16")
+    df["source"] = df["source"].astype("category")
+    return df
+
+
+def build_index(files):
+    os.makedirs(output_directory, exist_ok=True)
+    # sources whose index is newer than their input are not rescanned
+    todo = [f for f in files
+            if not os.path.exists(index_output_path(f)) or os.path.getmtime(index_output_path(f)) < os.path.getmtime(f)]
+    print(f"[✓] Indexing {len(todo)} of {len(files)} files ({len(files) - len(todo)} up to date)")
+    total = 0
+    started = time.time()
+    # largest files first, so one big article does not finish last
+    todo.sort(key=os.path.getsize, reverse=True)
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(index_file, f) for f in todo]
+        for future in as_completed(futures):
+            file_path, count, elapsed = future.result()
+            total += count
+            print(f"[{file_path}] {count} revisions in {elapsed:.1f}s")
+    elapsed = time.time() - started
+    print(f"[✓] {total} revisions indexed in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} revisions/s)")
+
+
+# ----------------------------
+# Loading and stance-flip queries
+# ----------------------------
+
+def load_index(directory=output_directory, columns=None):
+    """
+    Returns: one DataFrame with the rows of every source (optionally only some columns).
+    """
+    frames = []
+    for f in sorted(os.listdir(directory)):
+        path = os.path.join(directory, f)
+        if f.endswith("_terms.parquet"):
+            frames.append(pd.read_parquet(path, columns=columns))
+        elif f.endswith("_terms.csv"):
+            frames.append(pd.read_csv(path, usecols=columns))
+    return pd.concat(frames, ignore_index=True)
+
+
+def stance_flips(df, pairs):
+    """
+    pairs: list of (a, b) term groups
+
+    Returns: boolean DataFrame with a column "a->b" (a removed and b added in
+    the same revision) and "b->a" for every pair, aligned with df.
+    """
+    flips = {}
+    for a, b in pairs:
+        flips[f"{a}->{b}"] = (df[f"{a}_removed"] > 0) & (df[f"{b}_added"] > 0)
+        flips[f"{b}->{a}"] = (df[f"{b}_removed"] > 0) & (df[f"{a}_added"] > 0)
+    return pd.DataFrame(flips, index=df.index)
+
+
+def flip_summary(df, pairs):
+    # Number of flip revisions per source and direction
+    flips = stance_flips(df, pairs)
+    summary = flips.groupby(df["source"], observed=True).sum()
+    return summary.loc[summary.sum(axis=1) > 0]
+
+
+if __name__ == "__main__":
+    # python term_index.py [input_directory]
+    if len(sys.argv) > 1:
+        input_directory = sys.argv[1]
+    files = [os.path.join(input_directory, f) for f in os.listdir(input_directory) if f.endswith(".jsonl")]
+    build_index(files)
+    _, pairs = load_lexicon(lexicon_path)
+    print(flip_summary(load_index(), pairs))
@@ -0,0 +1,198 @@
+import os
+import re
+import sys
+import threading
+from collections import Counter
+
+from record_stream import iter_jsonl
+from lexicon import lexicon_hits
+
+# Edits changing at most this many words (no digits, no lexicon hit) are cleared
+small_edit_words = 2
+
+# For evaluate_triage: enriched records and the LLM judgments made for them
+records_directory = "../enriched_demo"
+judgments_directory = "../data/txt_results_demo"
+
+
+# ----------------------------
+# Rule and lexicon triage
+# ----------------------------
+# Whitespace, punctuation, markup, interwiki / category and bot edits are
+# judged "Not Weaponised" every time, so they are cleared locally instead of
+# being sent to the LLM. Any lexicon hit in the changed text or the edit
+# comment always goes to the LLM, whatever the other rules say.
+
+# Bot accounts follow the naming convention "FooBot" / "FooBOT" / "Foo bot" /
+# "Foo_bot" (optionally with a version, "ClueBot NG"); names that merely end
+# in "bot" ("Talbot", "Cabot") are people
+BOT_USER = re.compile(r"(?:(?:^|[\s_-])[Bb][Oo][Tt]|[a-z0-9](?:Bot|BOT))(?:[\s_-]?(?:NG|II|III|\d+))?$")
+# Links to other language editions, categories and sort keys
+INTERWIKI_LINE = re.compile(r"^(\[\[([a-z]{2,3}(-[a-z]+)*|category|kategorie|catégorie):[^\]]*\]\]\s*)+$"
+                            r"|^\{\{defaultsort:[^}]*\}\}$", re.IGNORECASE)
+MARKUP = re.compile(r"\[\[|\]\]|\{\{|\}\}|''+|<[^>]*>|[|=*#:;]")
+
+
+def _plain_words(texts):
+    return Counter(re.findall(r"\w+", MARKUP.sub(" ", " ".join(texts)).lower()))
+
+
+def _modified_lines(diff_text):
+    # Both sides of every "-" line directly followed by a "+" line, walked the
+    # same way parse_unidiff pairs them
+    lines = diff_text.splitlines()
+    modified = []
+    i = 0
+    while i < len(lines):
+        if lines[i].startswith(('@@', '---', '+++')):
+            i += 1
+        elif lines[i].startswith('-') and i + 1 < len(lines) and lines[i + 1].startswith('+'):
+            modified.extend([lines[i][1:], lines[i + 1][1:]])
+            i += 2
+        else:
+            i += 1
+    return modified
+
+
+def triage_record(record):
+    """
+    record: an enriched record (Added_Lines, Removed_Lines, Added_Words,
+    Removed_Words as produced by parse_unidiff)
+
+    Returns: (cleared, reason) - cleared is True when the record can be judged
+    "Not Weaponised" without the LLM.
+    """
+    if record.get("version") != "diff":
+        return False, "first version"
+
+    added = record.get("Added_Lines", []) + record.get("Added_Words", [])
+    removed = record.get("Removed_Lines", []) + record.get("Removed_Words", [])
+    changed = [t for t in added + removed if t.strip()]
+    if not changed:
+        return True, "empty diff"
+
+    hits = lexicon_hits(" ".join(changed + [record.get("Comment", "") or ""]))
+    if hits:
+        return False, "lexicon: " + ", ".join(hits[:5])
+
+    if BOT_USER.search(record.get("User", "") or ""):
+        return True, "bot user"
+
+    lines = [line for line in record.get("Added_Lines", []) + record.get("Removed_Lines", []) if line.strip()]
+    words = record.get("Added_Words", []) + record.get("Removed_Words", [])
+    if lines and not words and all(INTERWIKI_LINE.match(line.strip()) for line in lines):
+        return True, "interwiki / category"
+
+    added_plain = _plain_words(added)
+    removed_plain = _plain_words(removed)
+    if added_plain == removed_plain:
+        return True, "markup / punctuation only"
+
+    diff = (added_plain - removed_plain) + (removed_plain - added_plain)
+    if sum(diff.values()) <= small_edit_words and not any(c.isdigit() for word in diff for c in word):
+        # a small word change in a sentence about the topic may still shift it
+        hits = lexicon_hits(" ".join(_modified_lines(record.get("Diff", ""))))
+        if hits:
+            return False, "small edit, lexicon: " + ", ".join(hits[:5])
+        return True, "small edit"
+
+    return False, "needs LLM"
+
+
+class TriageStats:
+    # Records cleared per rule, shared by worker threads
+    def __init__(self):
+        self.records = 0
+        self.cleared = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, cleared, reason):
+        with self._lock:
+            self.records += 1
+            if cleared:
+                self.cleared[reason] += 1
+
+    def print_stats(self):
+        total = sum(self.cleared.values())
+        share = total / self.records if self.records else 0.0
+        details = ", ".join(f"{reason} {count}" for reason, count in self.cleared.most_common())
+        print(f"[triage] {total} of {self.records} records auto-cleared ({share:.1%}): {details}")
+
+
+# ----------------------------
+# Evaluation against earlier LLM judgments
+# ----------------------------
+
+def load_text_judgments(analysis_path):
+    """
+    Returns: dict record number -> "Weaponised" / "Not Weaponised" from an
+    _analysis.txt file (records without a judgment, e.g. API errors, are left out).
+    """
+    judgments = {}
+    with open(analysis_path, "r", encoding="utf-8") as f:
+        blocks = f.read().split("-" * 80)
+    for block in blocks:
+        record = re.search(r"Record\s+(\d+)", block)
+        judgment = re.search(r"(Not Weaponi[sz]ed|Weaponi[sz]ed)", block)
+        if record and judgment:
+            judgments[int(record.group(1))] = "Not Weaponised" if judgment.group(1).startswith("Not") else "Weaponised"
+    return judgments
+
+
+def evaluate_triage(records_dir=records_directory, judgments_dir=judgments_directory):
+    """
+    Triage every record of records_dir/<name>_enriched*.jsonl and compare with
+    the LLM judgments of judgments_dir/<name>_analysis*.txt.
+
+    Returns: dict with the confusion counts, the share of calls saved, the
+    precision of clearing (cleared records the LLM found not weaponised) and
+    the recall of weaponised records (kept for the LLM).
+    """
+    analyses = {f.split("_analysis")[0]: os.path.join(judgments_dir, f)
+                for f in os.listdir(judgments_dir) if "_analysis" in f and f.endswith(".txt")}
+    confusion = Counter()
+    missed = Counter()  # rule -> weaponised records it cleared
+    for f in sorted(os.listdir(records_dir)):
+        name = f.split("_enriched")[0]
+        if not f.endswith(".jsonl") or name not in analyses:
+            continue
+        judgments = load_text_judgments(analyses[name])
+        for idx, record in enumerate(iter_jsonl(os.path.join(records_dir, f)), start=1):
+            if idx not in judgments:
+                continue
+            cleared, reason = triage_record(record)
+            confusion[(cleared, judgments[idx])] += 1
+            if cleared and judgments[idx] == "Weaponised":
+                missed[reason] += 1
+
+    cleared_total = confusion[(True, "Weaponised")] + confusion[(True, "Not Weaponised")]
+    weaponised = confusion[(True, "Weaponised")] + confusion[(False, "Weaponised")]
+    total = sum(confusion.values())
+    return {
+        "records": total,
+        "confusion": confusion,
+        "calls_saved": cleared_total / total if total else 0.0,
+        "clear_precision": confusion[(True, "Not Weaponised")] / cleared_total if cleared_total else 0.0,
+        "weaponised_recall": confusion[(False, "Weaponised")] / weaponised if weaponised else 0.0,
+        "missed_by_rule": missed,
+    }
+
+
+def print_evaluation(result):
+    print(f"[triage] {result['records']} judged records, {result['calls_saved']:.1%} of LLM calls saved")
+    print(f"    clearing precision {result['clear_precision']:.1%} (cleared records judged Not Weaponised)")
+    print(f"    weaponised recall  {result['weaponised_recall']:.1%} (weaponised records still sent to the LLM)")
+    for (cleared, judgment), count in sorted(result["confusion"].items()):
+        print(f"    {'auto-cleared' if cleared else 'needs-LLM':13} {judgment:15} {count}")
+    for reason, count in result["missed_by_rule"].most_common():
+        print(f"    [!] {count} weaponised records cleared as '{reason}'")
+
+
+if __name__ == "__main__":
+    # python triage.py [records_dir] [judgments_dir]
+    directories = sys.argv[1:3] or [records_directory, judgments_directory]
+    missing = [d for d in directories if not os.path.isdir(d)]
+    if missing:
+        print(f"[!] Not found: {', '.join(missing)}")
+    else:
+        print_evaluation(evaluate_triage(*directories))
@@ -0,0 +1,163 @@
+from bisect import bisect_left
+from difflib import SequenceMatcher, IS_CHARACTER_JUNK
+from functools import lru_cache
+
+
+# ----------------------------
+# Word-level diff engine
+# ----------------------------
+# Produces exactly the words that difflib.ndiff(old_words, new_words) reports as
+# "+ " / "- ", without ndiff's quadratic intraline pass.
+#
+# ndiff first aligns the two word lists with SequenceMatcher, which is cheap on
+# interned token ids. The expensive part is Differ._fancy_replace: for every
+# "replace" block it scores every (old word, new word) pair character by
+# character, synchs on the best pair and recurses on both sides, rescoring the
+# same pairs at every level. For our output, only the synch points that land
+# on *identical* words matter (those words are reported as unchanged). So:
+#   - a block that has no word in common on both sides is reported whole,
+#     in O(n+m);
+#   - otherwise, the similar word pairs of the block are scored once (per
+#     unique pair of token ids), and each synch point is found with
+#     position lookups instead of a full rescan. A block with d synch points
+#     costs O((n+m)·d·log n).
+
+# Same thresholds as difflib.Differ._fancy_replace
+SIMILARITY_CUTOFF = 0.75
+SIMILARITY_FLOOR = 0.74
+
+
+@lru_cache(maxsize=1 << 16)
+def _similarity(old_word, new_word):
+    # Same scoring (and argument order) as the ndiff "cruncher"
+    return SequenceMatcher(IS_CHARACTER_JUNK, old_word, new_word).ratio()
+
+
+def _similar_pairs(words, a_ids, b_ids):
+    """
+    Returns: list of (ratio, old_id, new_id) for all non-identical pairs scoring
+    at least SIMILARITY_CUTOFF, best first.
+    """
+    pairs = []
+    for y in b_ids:
+        new_word = words[y]
+        ly = len(new_word)
+        for x in a_ids:
+            if x == y:
+                continue
+            old_word = words[x]
+            lx = len(old_word)
+            # real_quick_ratio upper bound, skips the character comparison
+            if 2.0 * min(lx, ly) / (lx + ly) <= SIMILARITY_FLOOR:
+                continue
+            ratio = _similarity(old_word, new_word)
+            if ratio >= SIMILARITY_CUTOFF:
+                pairs.append((ratio, x, y))
+    pairs.sort(key=lambda p: -p[0])
+    return pairs
+
+
+def _first_position(positions, lo, hi):
+    # First index of a sorted position list falling in [lo, hi), or None
+    k = bisect_left(positions, lo)
+    if k < len(positions) and positions[k] < hi:
+        return positions[k]
+    return None
+
+
+def _replace_block(a, b, words, old_words, new_words, alo, ahi, blo, bhi, added, removed):
+    a_ids, b_ids = set(a[alo:ahi]), set(b[blo:bhi])
+    if a_ids.isdisjoint(b_ids):
+        # Without an identical pair every word ends up as "-" or "+", whatever
+        # synch points ndiff would have picked
+        removed.extend(old_words[alo:ahi])
+        added.extend(new_words[blo:bhi])
+        return
+
+    a_positions, b_positions = {}, {}
+    for i in range(alo, ahi):
+        a_positions.setdefault(a[i], []).append(i)
+    for j in range(blo, bhi):
+        b_positions.setdefault(b[j], []).append(j)
+    similar = _similar_pairs(words, a_ids, b_ids)
+
+    # Explicit stack instead of recursion: ("range", ...) items are split on
+    # their synch point, ("pair", i, j) items emit a synched non-identical pair.
+    # Items are pushed right-to-left so the output keeps the sequence order.
+    stack = [("range", alo, ahi, blo, bhi)]
+    while stack:
+        item = stack.pop()
+        if item[0] == "pair":
+            removed.append(old_words[item[1]])
+            added.append(new_words[item[2]])
+            continue
+
+        _, lo_a, hi_a, lo_b, hi_b = item
+        if lo_a >= hi_a:
+            added.extend(new_words[lo_b:hi_b])
+            continue
+        if lo_b >= hi_b:
+            removed.extend(old_words[lo_a:hi_a])
+            continue
+
+        # Best non-identical pair present in the range; ties go to the first
+        # pair in ndiff's scan order (new word major, old word minor)
+        best_ratio, best = None, None
+        for ratio, x, y in similar:
+            if best_ratio is not None and ratio < best_ratio:
+                break
+            j = _first_position(b_positions[y], lo_b, hi_b)
+            if j is None:
+                continue
+            i = _first_position(a_positions[x], lo_a, hi_a)
+            if i is None:
+                continue
+            if best is None or (j, i) < best:
+                best_ratio, best = ratio, (j, i)
+
+        if best is not None:
+            best_j, best_i = best
+            identical = False
+        else:
+            # No close pair: synch on the first identical pair, if any
+            for j in range(lo_b, hi_b):
+                i = _first_position(a_positions.get(b[j], ()), lo_a, hi_a)
+                if i is not None:
+                    best_i, best_j = i, j
+                    break
+            else:
+                removed.extend(old_words[lo_a:hi_a])
+                added.extend(new_words[lo_b:hi_b])
+                continue
+            identical = True
+
+        stack.append(("range", best_i + 1, hi_a, best_j + 1, hi_b))
+        if not identical:
+            stack.append(("pair", best_i, best_j))
+        stack.append(("range", lo_a, best_i, lo_b, best_j))
+
+
+def diff_words(old_words, new_words):
+    """
+    old_words, new_words: lists of words (e.g. removed_line.split())
+
+    Returns: (added_words, removed_words), identical to the "+ " / "- " entries
+    of difflib.ndiff(old_words, new_words).
+    """
+    # Intern words to integer ids: cheaper hashing/equality in the matcher and
+    # a compact key for the similarity cache
+    vocab = {}
+    a = [vocab.setdefault(w, len(vocab)) for w in old_words]
+    b = [vocab.setdefault(w, len(vocab)) for w in new_words]
+    words = list(vocab)
+
+    added, removed = [], []
+    matcher = SequenceMatcher(None, a, b)
+    for tag, alo, ahi, blo, bhi in matcher.get_opcodes():
+        if tag == "replace":
+            _replace_block(a, b, words, old_words, new_words, alo, ahi, blo, bhi, added, removed)
+        elif tag == "delete":
+            removed.extend(old_words[alo:ahi])
+        elif tag == "insert":
+            added.extend(new_words[blo:bhi])
+    return added, removed
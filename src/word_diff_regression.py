@@ -0,0 +1,136 @@
+import os
+import sys
+import glob
+import time
+import random
+import difflib
+
+from record_stream import iter_jsonl, save_jsonl
+from word_diff import diff_words
+
+# Regression corpus of (old line, new line) pairs with the Added_Words /
+# Removed_Words produced by the original difflib.ndiff implementation.
+corpus_path = "../data/word_diff_regression_corpus.jsonl"
+# Demo analysis texts used as a source of realistic prose for synthetic edits
+text_directory = "../data/txt_results_demo"
+# Optional: enriched revisions to harvest real "-"/"+" line pairs from
+enriched_directory = "../enriched_demo"
+
+synthetic_pairs = 400
+max_enriched_pairs = 400
+seed = 42
+
+
+def reference_diff_words(old_words, new_words):
+    # The implementation parse_unidiff used before word_diff existed
+    word_added, word_removed = [], []
+    for word in difflib.ndiff(old_words, new_words):
+        if word.startswith('+ '):
+            word_added.append(word[2:])
+        elif word.startswith('- '):
+            word_removed.append(word[2:])
+    return word_added, word_removed
+
+
+# ----------------------------
+# Corpus construction
+# ----------------------------
+
+def _mutate(rng, words, vocabulary):
+    def typo(word):
+        k = rng.randrange(len(word))
+        return word[:k] + rng.choice("aeinost") + word[k + 1:]
+
+    new_words = list(words)
+    for _ in range(rng.randint(0, len(words) // 4 + 1)):
+        if not new_words:
+            break
+        k = rng.randrange(len(new_words))
+        op = rng.random()
+        if op < 0.35:
+            new_words[k] = typo(new_words[k])
+        elif op < 0.55:
+            new_words.insert(k, rng.choice(vocabulary))
+        elif op < 0.75:
+            del new_words[k]
+        elif op < 0.9:
+            new_words[k] = rng.choice(vocabulary)
+        else:
+            # wiki markup edits: links, categories and citations
+            new_words[k] = rng.choice(["[[" + new_words[k] + "]]", "{{cn}}", "[[Category:" + new_words[k] + "]]"])
+    return new_words
+
+
+def synthetic_line_pairs(num_pairs):
+    rng = random.Random(seed)
+    words = []
+    for path in sorted(glob.glob(os.path.join(text_directory, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            words.extend(f.read().split())
+
+    for idx in range(num_pairs):
+        # mostly sentence-sized lines, with some whole-paragraph lines
+        length = rng.randint(1, 60) if idx % 20 else rng.randint(300, 1500)
+        start = rng.randrange(len(words) - length)
+        old_words = words[start:start + length]
+        if idx % 25 == 0:
+            # unrelated rewrite of the whole line
+            start = rng.randrange(len(words) - length)
+            new_words = words[start:start + length]
+        else:
+            new_words = _mutate(rng, old_words, words)
+        yield " ".join(old_words), " ".join(new_words)
+
+
+def enriched_line_pairs(max_pairs):
+    if not os.path.isdir(enriched_directory):
+        return
+    count = 0
+    for path in sorted(glob.glob(os.path.join(enriched_directory, "*.jsonl"))):
+        for record in iter_jsonl(path):
+            if record.get("version") != "diff":
+                continue
+            lines = record.get("Diff", "").splitlines()
+            for line, next_line in zip(lines, lines[1:]):
+                if line.startswith('-') and not line.startswith('---') and next_line.startswith('+') and not next_line.startswith('+++'):
+                    yield line[1:].strip(), next_line[1:].strip()
+                    count += 1
+                    if count >= max_pairs:
+                        return
+
+
+def build_corpus():
+    def entries():
+        pairs = list(enriched_line_pairs(max_enriched_pairs)) + list(synthetic_line_pairs(synthetic_pairs))
+        for idx, (old_line, new_line) in enumerate(pairs):
+            added, removed = reference_diff_words(old_line.split(), new_line.split())
+            yield {"id": idx, "old": old_line, "new": new_line, "Added_Words": added, "Removed_Words": removed}
+
+    count = save_jsonl(corpus_path, entries())
+    print(f"[✓] Wrote {count} line pairs to {corpus_path}")
+
+
+# ----------------------------
+# Regression check
+# ----------------------------
+
+def run_regression():
+    mismatches = 0
+    total = 0
+    elapsed = 0.0
+    for entry in iter_jsonl(corpus_path):
+        total += 1
+        start = time.perf_counter()
+        added, removed = diff_words(entry["old"].split(), entry["new"].split())
+        elapsed += time.perf_counter() - start
+        if added != entry["Added_Words"] or removed != entry["Removed_Words"]:
+            mismatches += 1
+            print(f"[!] Mismatch on pair {entry['id']}")
+    print(f"[{'✓' if not mismatches else '!'}] {total - mismatches}/{total} pairs identical to difflib.ndiff ({elapsed:.2f}s)")
+    return mismatches
+
+
+if __name__ == "__main__":
+    if "--build" in sys.argv or not os.path.exists(corpus_path):
+        build_corpus()
+    sys.exit(1 if run_regression() else 0)